@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import redirect
+from rest_framework.routers import DefaultRouter
+
+from recipes.models import Recipe
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def async_read_view(sync_view):
+    """Асинхронное представление поверх представления DRF-вьюсета.
+
+    GET и HEAD обслуживают методы alist/aretrieve вьюсета на async ORM,
+    остальные методы уходят в синхронное представление через поток.
+    """
+    viewset = sync_view.cls
+    actions = {'head': sync_view.actions['get'], **sync_view.actions}
+
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        self = viewset(**sync_view.initkwargs)
+        self.action_map = actions
+        for method, action in actions.items():
+            setattr(self, method, getattr(self, action))
+        self.setup(request, *args, **kwargs)
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # аутентификация и права могут обращаться к базе
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response, *args, **kwargs)
+
+    view.cls = viewset
+    view.initkwargs = sync_view.initkwargs
+    view.actions = sync_view.actions
+    view.csrf_exempt = True
+    return view
+
+
+class AsyncReadRouter(DefaultRouter):
+    """Роутер: list и retrieve вьюсетов с AsyncReadMixin асинхронны.
+
+    Под WSGI каждое асинхронное представление запускает свой цикл
+    событий, поэтому там их отключают настройкой ASYNC_READ_VIEWS.
+    """
+
+    def get_urls(self):
+        urls = super().get_urls()
+        if not settings.ASYNC_READ_VIEWS:
+            return urls
+        for url in urls:
+            view = url.callback
+            action = getattr(view, 'actions', {}).get('get')
+            if hasattr(getattr(view, 'cls', None), f'a{action}'):
+                url.callback = async_read_view(view)
+        return urls
+
+
+async def short_link_redirect(request, slug):
+    recipe_id = await (Recipe.objects.filter(short_url=slug)
+                       .values_list('id', flat=True).afirst())
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}/')
@@ -0,0 +1,118 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from foodgram.db_router import reading_from_replica, use_database
+
+from . import constants
+
+TOKEN_KEY = 'auth_token:v2:{}'
+# меняются F()-выражениями без post_save и кеш токенов не сбрасывают
+USER_COUNTERS = ('recipes_count', 'followers_count')
+
+
+class TokenCache:
+    """Пользователи по ключам токенов: LRU процесса и общий кеш.
+
+    Запись в LRU живет TOKEN_LOCAL_CACHE_TTL секунд: сброс в других
+    процессах доходит до них не позже этого срока, в текущем процессе
+    и в общем кеше действует сразу.
+    """
+
+    def __init__(self, size=constants.TOKEN_LOCAL_CACHE_SIZE,
+                 ttl=constants.TOKEN_LOCAL_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    @staticmethod
+    def cache_key(key):
+        """Ключ общего кеша: сам токен в кеш не попадает."""
+        return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        cache_key = self.cache_key(key)
+        with self._lock:
+            expires, user = self._users.get(cache_key, (0, None))
+            if expires > time.monotonic():
+                self._users.move_to_end(cache_key)
+                # вызывающий код может менять request.user
+                return copy.copy(user)
+        user = cache.get(cache_key)
+        if user is not None:
+            self._remember(cache_key, user)
+        return user
+
+    def set(self, key, user):
+        cache_key = self.cache_key(key)
+        cache.set(cache_key, user, constants.TOKEN_CACHE_TIMEOUT)
+        self._remember(cache_key, user)
+
+    def delete(self, *keys):
+        cache_keys = [self.cache_key(key) for key in keys]
+        cache.delete_many(cache_keys)
+        with self._lock:
+            for cache_key in cache_keys:
+                self._users.pop(cache_key, None)
+
+    def _remember(self, cache_key, user):
+        with self._lock:
+            self._users[cache_key] = (time.monotonic() + self.ttl,
+                                      copy.copy(user))
+            self._users.move_to_end(cache_key)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе при попадании в кеш.
+
+    Кеш сбрасывается сигналами: при удалении токена (в том числе при
+    выходе через djoser) и при изменении пользователя. Токен, которого
+    нет на реплике, ищется еще и в основной базе: только что выданный
+    токен мог до реплики не дойти.
+
+    Счетчики пользователя не загружаются: save() пользователя с
+    отложенными полями записывает только загруженные, и устаревшие
+    значения из кеша в базу не попадают. Прочитанный счетчик
+    загружается из базы.
+    """
+
+    def fetch_credentials(self, key):
+        """authenticate_credentials DRF без счетчиков пользователя."""
+        model = self.get_model()
+        try:
+            token = (model.objects.select_related('user')
+                     .defer(*(f'user__{name}' for name in USER_COUNTERS))
+                     .get(key=key))
+        except model.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            return user, self.get_model()(key=key, user=user)
+        try:
+            user, token = self.fetch_credentials(key)
+        except AuthenticationFailed:
+            if not reading_from_replica():
+                raise
+            with use_database(DEFAULT_DB_ALIAS):
+                user, token = self.fetch_credentials(key)
+        token_cache.set(key, user)
+        return user, token
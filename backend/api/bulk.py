@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from recipes.models import Favorite, PurchaseUser, Recipe
+from recipes.shopping_list import change_cart, lock_users
+from recipes.signals import bulk_changes
+
+from .utils import bump_shopping_cart_version
+from .versions import bump_versions
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+
+
+class RecipeRelation:
+    """Массовые изменения избранного или корзины пользователя.
+
+    Строки добавляются одним INSERT ... ON CONFLICT DO NOTHING, который
+    сигналов не отправляет, а при удалении обработчики сигналов
+    пропускаются (recipes.signals.bulk_changes). Счетчики рецептов,
+    списки покупок и версии обновляются здесь же одним запросом на все
+    строки, а не построчно. Изменения одного пользователя выполняются
+    по очереди, чтобы результат по каждому рецепту и счетчики были
+    точными.
+    """
+
+    def __init__(self, model, field, counter, shopping_list=False):
+        self.model = model
+        self.key = f'{field}_id'
+        self.counter = counter
+        self.shopping_list = shopping_list
+
+    def rows(self, user, recipe_ids=None):
+        rows = self.model.objects.filter(user=user).order_by()
+        if recipe_ids is None:
+            return rows
+        return rows.filter(**{f'{self.key}__in': recipe_ids})
+
+    def recipe_ids(self, user, recipe_ids=None):
+        return set(self.rows(user, recipe_ids).values_list(self.key,
+                                                           flat=True))
+
+    def add(self, user, recipe_ids):
+        """Добавление рецептов; статус added, exists или not_found."""
+        with transaction.atomic():
+            lock_users([user.pk])
+            found = set(Recipe.objects.filter(pk__in=recipe_ids)
+                        .values_list('pk', flat=True).order_by())
+            new = found - self.recipe_ids(user, found)
+            added = [pk for pk in recipe_ids if pk in new]
+            self.model.objects.bulk_create(
+                [self.model(user=user, **{self.key: pk}) for pk in added],
+                ignore_conflicts=True)
+            self.changed(user, added, 1)
+        return [{'id': pk, 'status': (ADDED if pk in new else
+                                      EXISTS if pk in found else NOT_FOUND)}
+                for pk in recipe_ids]
+
+    def remove(self, user, recipe_ids=None):
+        """Удаление рецептов (всех, если список не задан).
+
+        Статус removed или absent, если рецепта в списке не было.
+        """
+        with transaction.atomic():
+            lock_users([user.pk])
+            existing = self.recipe_ids(user, recipe_ids)
+            if recipe_ids is None:
+                recipe_ids = sorted(existing)
+            removed = [pk for pk in recipe_ids if pk in existing]
+            if removed:
+                # changed() ниже учитывает все строки сразу, поэтому
+                # построчные обработчики удаления не должны их учесть
+                # второй раз
+                with bulk_changes(self.model):
+                    self.rows(user, removed).delete()
+            self.changed(user, removed, -1)
+        return [{'id': pk, 'status': REMOVED if pk in existing else ABSENT}
+                for pk in recipe_ids]
+
+    def changed(self, user, recipe_ids, sign):
+        if not recipe_ids:
+            return
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            **{self.counter: Greatest(F(self.counter) + sign, 0)})
+        if self.shopping_list:
+            change_cart(user.pk, recipe_ids, sign)
+        transaction.on_commit(lambda: self.bump(user.pk))
+
+    def bump(self, user_id):
+        bump_versions(f'user:{user_id}')
+        if self.shopping_list:
+            bump_shopping_cart_version(user_id)
+
+
+favorites = RecipeRelation(Favorite, 'recipe', 'favorites_count')
+shopping_cart = RecipeRelation(PurchaseUser, 'purchase', 'purchases_count',
+                               shopping_list=True)
@@ -3,3 +3,40 @@ SAFE_ACTION_FOR_RECIPE = ['list', 'retrieve', 'get_short_link']
 ACTION_FOR_USER = ['me', 'update_avatar', 'subscriptions', 'delete_avatar',
                    'create_subscribe', 'delete_subscribe', 'add_favorite',
                    'delete_favorite']
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_REPRESENTATION_TIMEOUT = 60 * 60 * 24
+RECIPE_REPRESENTATION_REPLICA_TIMEOUT = 60
+SHOPPING_CART_CHUNK_SIZE = 8192
+
+TOKEN_CACHE_TIMEOUT = 60 * 5
+TOKEN_LOCAL_CACHE_TTL = 5
+TOKEN_LOCAL_CACHE_SIZE = 10_000
+
+PRIMARY_PIN_KEY = 'db_pin:{}'
+PRIMARY_PIN_COOKIE = 'primary_until'
+
+QUERY_BUDGETS = {
+    'recipe-list-anonymous': 5,
+    'recipe-list-authenticated': 6,
+    'recipe-detail-anonymous': 3,
+    'recipe-detail-authenticated': 4,
+    # без tsvector (SQLite) создание рецепта добавляет INSERT слов поиска
+    'recipe-create': 13,
+}
+
+MAX_RECIPES_LIMIT = 50
+BULK_RECIPES_LIMIT = 100
+
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+METRICS_COUNTERS = (
+    ('queries', 'foodgram_request_queries_total',
+     'Database queries per API action.'),
+    ('db', 'foodgram_request_db_seconds_total',
+     'Time spent in database queries per API action.'),
+    ('serialize', 'foodgram_request_serialize_seconds_total',
+     'Time spent serializing responses per API action.'),
+)
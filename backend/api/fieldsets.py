@@ -0,0 +1,108 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+class Fieldset:
+    """Поля ответа из параметров ?fields= и ?expand=.
+
+    fields — поля верхнего уровня, без параметра выводятся все.
+    expand — связи, выводимые вложенными объектами: без параметра
+    раскрыты все, иначе остальные связи выводятся как id. Раскрытая
+    связь выводится, даже если ее нет в fields.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def __init__(self, serializer_class, fields=None, expand=None):
+        self.serializer_class = serializer_class
+        if fields is not None and expand is not None:
+            fields = fields | expand
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request, serializer_class):
+        """Набор полей запроса или None, если параметры не заданы."""
+        fields = cls.names(request, cls.fields_query_param)
+        expand = cls.names(request, cls.expand_query_param)
+        if fields is None and expand is None:
+            return None
+        errors = {}
+        for param, names, known in (
+                (cls.fields_query_param, fields,
+                 serializer_class.Meta.fields),
+                (cls.expand_query_param, expand,
+                 serializer_class.collapsed_fields)):
+            unknown = sorted((names or set()) - set(known))
+            if unknown:
+                errors[param] = f'Неизвестные поля: {", ".join(unknown)}.'
+        if errors:
+            raise ValidationError(errors)
+        return cls(serializer_class, fields, expand)
+
+    @staticmethod
+    def names(request, param):
+        value = request.query_params.get(param)
+        if value is None:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.includes(name) and (self.expand is None
+                                        or name in self.expand)
+
+
+class SparseFieldsMixin:
+    """Поля сериализатора по набору из контекста (ключ fieldset).
+
+    Нераскрытые связи из collapsed_fields заменяются полями с их id.
+    Вложенные сериализаторы других классов выводятся полностью.
+    """
+    collapsed_fields = {}
+
+    @property
+    def fieldset(self):
+        fieldset = self.context.get('fieldset')
+        if fieldset is not None and isinstance(self,
+                                               fieldset.serializer_class):
+            return fieldset
+        return None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset is None:
+            return fields
+        return {
+            name: (self.collapsed_fields[name]()
+                   if name in self.collapsed_fields
+                   and not fieldset.expands(name) else field)
+            for name, field in fields.items() if fieldset.includes(name)}
+
+
+def model_columns(serializer, prefix=''):
+    """Колонки модели, нужные полям сериализатора, для QuerySet.only().
+
+    Вложенный сериализатор внешнего ключа добавляет колонки связанной
+    модели; для select_related они получают префикс связи.
+    """
+    opts = serializer.Meta.model._meta
+    columns = [prefix + opts.pk.name]
+    for field in serializer.fields.values():
+        # поля, читающие несколько колонок, перечисляют их в columns
+        columns += [prefix + name for name in getattr(field, 'columns', ())]
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.concrete:
+            continue
+        columns.append(prefix + field.source)
+        if (model_field.is_relation
+                and isinstance(field, serializers.BaseSerializer)):
+            columns += model_columns(field, f'{prefix}{field.source}__')
+    return list(dict.fromkeys(columns))
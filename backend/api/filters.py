@@ -1,6 +1,10 @@
 import django_filters
+from django.db.models import F
 
 from recipes.models import Recipe, Tag, Ingredient
+from recipes.utils import tags_mask
+
+from .search import search_ingredients, search_recipes
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -8,15 +12,51 @@ class RecipeFilter(django_filters.FilterSet):
         field_name='tag__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
-        conjoined=False
+        conjoined=False,
+        method='method_for_tags'
+    )
+    tags_all = django_filters.ModelMultipleChoiceFilter(
+        field_name='tag__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        conjoined=True,
+        method='method_for_all_tags'
     )
     is_in_shopping_cart = django_filters.CharFilter(
         method='method_for_shopping_cart')
     is_favorited = django_filters.CharFilter(method='method_for_favorited')
+    search = django_filters.CharFilter(method='method_for_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited')
+        fields = ('tags', 'tags_all', 'author', 'is_in_shopping_cart',
+                  'is_favorited', 'search')
+
+    def method_for_tags(self, queryset, name, value):
+        return self.filter_by_tags_mask(queryset, value, conjoined=False)
+
+    def method_for_all_tags(self, queryset, name, value):
+        return self.filter_by_tags_mask(queryset, value, conjoined=True)
+
+    @staticmethod
+    def filter_by_tags_mask(queryset, value, conjoined):
+        """Отбор по маске тегов одним условием без JOIN и DISTINCT.
+
+        Теги без бита в маске отбираются прежним способом через JOIN.
+        """
+        if not value:
+            return queryset
+        if any(tag.bit is None for tag in value):
+            if not conjoined:
+                return queryset.filter(tag__in=value).distinct()
+            for tag in value:
+                queryset = queryset.filter(tag=tag)
+            return queryset
+        mask = tags_mask(tag.bit for tag in value)
+        queryset = queryset.alias(selected_tags=F('tags_mask').bitand(mask))
+        if conjoined:
+            return queryset.filter(selected_tags=mask)
+        return queryset.filter(selected_tags__gt=0)
 
     def method_for_favorited(self, queryset, name, value):
         value = True if value == '1' else False
@@ -26,11 +66,16 @@ class RecipeFilter(django_filters.FilterSet):
         value = True if value == '1' else False
         return queryset.filter(is_in_shopping_cart=value)
 
+    def method_for_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name',
-                                     lookup_expr='icontains')
+    name = django_filters.CharFilter(method='method_for_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def method_for_name(self, queryset, name, value):
+        return search_ingredients(queryset, value)
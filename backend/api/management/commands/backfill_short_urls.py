@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.utils import backfill_short_urls
+
+
+class Command(BaseCommand):
+    help = ('Assign deterministic short links to recipes that have none. '
+            'Legacy random links are kept; a recipe whose encoded id is held '
+            'by one gets a fallback code')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rewrite-all', action='store_true',
+            help='Re-encode every recipe link (breaks legacy links)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_short_urls(Recipe, options['rewrite_all'],
+                                      options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated short links of {updated} recipes'))
@@ -0,0 +1,220 @@
+import asyncio
+import os
+import resource
+import shlex
+import socket
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+
+SERVERS = {
+    'wsgi': ('gunicorn foodgram.wsgi --bind 127.0.0.1:{port} '
+             '--workers {workers} --log-level warning', 'False'),
+    'asgi': ('uvicorn foodgram.asgi:application --host 127.0.0.1 '
+             '--port {port} --workers {workers} --no-access-log '
+             '--log-level warning', 'True'),
+}
+REQUEST_TIMEOUT = 30
+SLOW_CLIENT_LINES = 5
+
+
+class Command(BaseCommand):
+    help = ('Start the project under gunicorn sync workers (WSGI) and under '
+            'uvicorn (ASGI, async read views), load the read endpoints '
+            'with many concurrent keep-alive connections and compare '
+            'requests/s, latency, errors and memory of the server '
+            'processes. Uses the current database, see generate_dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=SERVERS,
+                            default=list(SERVERS))
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Seconds of load per server (default: 20)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Server worker processes (default: 4)')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Extra connections that send request headers one line per '
+                 'second, like clients on a bad network (default: 0)')
+
+    def handle(self, *args, **options):
+        self.raise_open_files_limit(options['connections']
+                                    + options['slow_clients'])
+        paths = self.paths()
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                     if host != '*'), 'localhost')
+        for name in options['servers']:
+            command, async_views = SERVERS[name]
+            server = subprocess.Popen(
+                shlex.split(command.format(**options)),
+                cwd=settings.BASE_DIR,
+                env={**os.environ, 'ASYNC_READ_VIEWS': async_views})
+            try:
+                self.wait_until_ready(server, options['port'])
+                result = asyncio.run(self.load(
+                    server.pid, options, paths, host))
+            finally:
+                server.terminate()
+                server.wait()
+            self.report(name, result, options['duration'])
+
+    @staticmethod
+    def raise_open_files_limit(connections):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = connections + 256
+        if soft < wanted:
+            if hard != resource.RLIM_INFINITY and hard < wanted:
+                raise CommandError(f'Open files limit {hard} is too low '
+                                   f'for {connections} connections')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    @staticmethod
+    def paths():
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        if recipe is None:
+            raise CommandError('No recipes, run generate_dataset first')
+        return ['/api/recipes/?limit=6', f'/api/recipes/{recipe.pk}/',
+                '/api/tags/', '/api/ingredients/?name=%D1%81%D0%B0',
+                f'/s/{recipe.short_url}/']
+
+    @staticmethod
+    def wait_until_ready(server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Server exited with {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('Server did not start in time')
+
+    async def load(self, pid, options, paths, host):
+        result = {'latencies': [], 'errors': 0, 'rss': []}
+        deadline = time.monotonic() + options['duration']
+        sampler = asyncio.create_task(self.sample_memory(pid, result))
+        await asyncio.gather(*(
+            self.client(options['port'], host, paths[number % len(paths):]
+                        + paths[:number % len(paths)], deadline, result)
+            for number in range(options['connections'])), *(
+            self.slow_client(options['port'], host, paths[0], deadline)
+            for _ in range(options['slow_clients'])))
+        sampler.cancel()
+        return result
+
+    async def client(self, port, host, paths, deadline, result):
+        """Одно соединение: запросы подряд, переподключение при закрытии."""
+        connection = None
+        number = 0
+        while time.monotonic() < deadline:
+            path = paths[number % len(paths)]
+            number += 1
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection(
+                        '127.0.0.1', port)
+                keep_alive = await asyncio.wait_for(
+                    self.request(*connection, host, path), REQUEST_TIMEOUT)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    ValueError):
+                result['errors'] += 1
+                keep_alive = False
+            else:
+                result['latencies'].append(time.perf_counter() - started)
+            if not keep_alive and connection is not None:
+                connection[1].close()
+                connection = None
+
+    @staticmethod
+    async def slow_client(port, host, path, deadline):
+        """Клиент, который отправляет заголовки по строке в секунду."""
+        while time.monotonic() < deadline:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                               port)
+                writer.write(f'GET {path} HTTP/1.1\r\n'.encode())
+                for _ in range(SLOW_CLIENT_LINES):
+                    await asyncio.sleep(1)
+                    writer.write(b'X-Slow-Client: 1\r\n')
+                    await writer.drain()
+                writer.write(f'Host: {host}\r\nConnection: close\r\n\r\n'
+                             .encode())
+                await asyncio.wait_for(reader.read(), REQUEST_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(1)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    @staticmethod
+    async def request(reader, writer, host, path):
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+        await writer.drain()
+        status, *lines = (await reader.readuntil(b'\r\n\r\n')).decode(
+            'latin-1').split('\r\n')
+        if int(status.split()[1]) >= 500:
+            raise ValueError(status)
+        headers = dict(line.lower().split(': ', 1) for line in lines if line)
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await reader.readline()).strip(), 16):
+                await reader.readexactly(size + 2)
+            await reader.readline()
+        else:
+            await reader.read()
+            return False
+        return headers.get('connection') != 'close'
+
+    @staticmethod
+    async def sample_memory(pid, result):
+        while True:
+            result['rss'].append(process_tree_rss(pid))
+            await asyncio.sleep(0.5)
+
+    def report(self, name, result, duration):
+        latencies = sorted(result['latencies'])
+        if len(latencies) < 2:
+            self.stdout.write(f'{name}: no successful requests, '
+                              f'{result["errors"]} errors')
+            return
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{name}: {len(latencies) / duration:.0f} req/s, '
+            f'p50={percentiles[49] * 1000:.0f}ms '
+            f'p99={percentiles[98] * 1000:.0f}ms, '
+            f'{result["errors"]} errors, '
+            f'peak RSS {max(result["rss"]) / 1024:.0f} MiB')
+
+
+def process_tree_rss(pid):
+    """Суммарная резидентная память процесса и его потомков, КиБ (Linux)."""
+    children = {}
+    for stat in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            fields = stat.read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    total, queue = 0, [pid]
+    while queue:
+        current = queue.pop()
+        queue += children.get(current, [])
+        try:
+            status = Path(f'/proc/{current}/status').read_text()
+        except OSError:
+            continue
+        total += next((int(line.split()[1]) for line in status.splitlines()
+                       if line.startswith('VmRSS:')), 0)
+    return total
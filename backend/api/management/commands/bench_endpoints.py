@@ -0,0 +1,246 @@
+import base64
+import io
+import json
+import statistics
+import time
+from itertools import count
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.utils import bump_shopping_cart_version
+from recipes.models import Favorite, Ingredient, PurchaseUser, Recipe, Tag
+from users.models import Follow, User
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'endpoints.json'
+DATASET_MODELS = (User, Recipe, Favorite, PurchaseUser, Follow)
+LATENCY_KEYS = ('p50_ms', 'p95_ms')
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the key API endpoints in-process against the current '
+            '(seeded, see generate_dataset) database: latency percentiles, '
+            'query count and response size. Compares the run with a JSON '
+            'baseline and fails on regressions past --threshold, or saves '
+            'a new baseline with --save. Writes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30,
+                            help='Timed runs per endpoint (default: 30)')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='Run only these benchmarks')
+        parser.add_argument('--baseline', type=Path,
+                            default=DEFAULT_BASELINE,
+                            help=f'Baseline file (default: '
+                                 f'{DEFAULT_BASELINE})')
+        parser.add_argument('--save', action='store_true',
+                            help='Save the run as the new baseline')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Allowed relative growth of latency and response size '
+                 '(default: 0.25). Query counts must not grow at all.')
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=2.0,
+            help='Ignore latency growth smaller than this (default: 2.0)')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('--repeat must be at least 2')
+        with transaction.atomic():
+            scenarios = self.scenarios()
+            unknown = set(options['only'] or ()) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Unknown benchmarks: {sorted(unknown)}, '
+                                   f'choose from {sorted(scenarios)}')
+            run = {'dataset': self.dataset(), 'endpoints': {
+                name: self.measure(name, user, steps, options)
+                for name, (user, steps) in scenarios.items()
+                if not options['only'] or name in options['only']}}
+            transaction.set_rollback(True)
+        if options['save']:
+            self.save(options['baseline'], run, merge=bool(options['only']))
+        else:
+            self.compare(options['baseline'], run, options)
+
+    @staticmethod
+    def dataset():
+        return {model._meta.db_table: model._base_manager.count()
+                for model in DATASET_MODELS}
+
+    def scenarios(self):
+        """Проверяемые запросы: пользователь и шаги запроса.
+
+        Шаг: метод, путь, данные (или функция, которая их вернет;
+        вызывается перед каждым запросом) и ожидаемый статус ответа.
+        """
+        reader = (User.objects.filter(recipes_count__gt=0)
+                  .annotate(cart=Count('buyer'))
+                  .order_by('-cart', 'pk').first())
+        subscriber = (User.objects.annotate(follows=Count('followers'))
+                      .order_by('-follows', 'pk').first())
+        if reader is None or subscriber is None:
+            raise CommandError('No data to benchmark, run generate_dataset '
+                               'first')
+        popular = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        other = (Recipe.objects.exclude(favorites__user=reader)
+                 .exclude(purchases__user=reader)
+                 .order_by('-favorites_count', 'pk').first())
+        own = Recipe.objects.filter(author=reader).order_by('pk').first()
+        tag = Tag.objects.exclude(bit=None).order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        feed = '/api/recipes/?limit=6'
+        filtered = (f'{feed}&is_favorited=1&is_in_shopping_cart=0'
+                    f'&tags={tag.slug if tag else ""}')
+        cards = (f'{feed}&fields=id,name,image,cooking_time,is_favorited,'
+                 f'is_in_shopping_cart&expand=author')
+        toggles = {
+            f'{name}-toggle': (reader, (
+                ('post', f'/api/recipes/{other.pk}/{action}/', None, 201),
+                ('delete', f'/api/recipes/{other.pk}/{action}/', None, 204)))
+            for name, action in (('favorite', 'favorite'),
+                                 ('cart', 'shopping_cart'))}
+        return {
+            'recipe-list-anonymous': (None, (('get', feed, None, 200),)),
+            'recipe-list-authenticated': (reader,
+                                          (('get', feed, None, 200),)),
+            'recipe-list-filtered': (reader, (('get', filtered, None, 200),)),
+            'recipe-list-cards': (reader, (('get', cards, None, 200),)),
+            'recipe-detail-anonymous': (None, (
+                ('get', f'/api/recipes/{popular.pk}/', None, 200),)),
+            'recipe-detail-authenticated': (reader, (
+                ('get', f'/api/recipes/{popular.pk}/', None, 200),)),
+            'recipe-create': (reader, (
+                ('post', '/api/recipes/', self.recipe_data(own), 201),)),
+            'recipe-update': (reader, (
+                ('patch', f'/api/recipes/{own.pk}/',
+                 {'name': 'bench update', 'cooking_time': 10}, 200),)),
+            **toggles,
+            'subscriptions': (subscriber, (
+                ('get', '/api/users/subscriptions/?limit=6&recipes_limit=3',
+                 None, 200),)),
+            'ingredient-search': (None, (
+                ('get', f'/api/ingredients/?name={ingredient.name[:3]}',
+                 None, 200),)),
+            'download-shopping-cart': (reader, (
+                ('get', '/api/recipes/download_shopping_cart/',
+                 self.cold_cart(reader), 200),)),
+            'download-shopping-cart-cached': (reader, (
+                ('get', '/api/recipes/download_shopping_cart/', None, 200),)),
+        }
+
+    @staticmethod
+    def recipe_data(recipe):
+        """Данные нового рецепта, название у автора должно быть новым."""
+        image = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(image, 'PNG')
+        numbers = count()
+        data = {
+            'text': 'bench', 'cooking_time': 1,
+            'image': ('data:image/png;base64,'
+                      + base64.b64encode(image.getvalue()).decode()),
+            'tags': list(recipe.tag.values_list('id', flat=True)),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount in recipe.recipe_ingredient
+                .values_list('ingredient_id', 'amount')],
+        }
+        return lambda: {**data, 'name': f'bench create {next(numbers)}'}
+
+    @staticmethod
+    def cold_cart(user):
+        """Сброс кеша списка покупок, чтобы замерить его построение."""
+        return lambda: bump_shopping_cart_version(user.pk)
+
+    def measure(self, name, user, steps, options):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        timings = []
+        for _ in range(options['warmup']):
+            self.request(name, client, steps)
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            queries, size = self.request(name, client, steps)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        result = {'p50_ms': round(statistics.median(timings), 3),
+                  'p95_ms': round(percentiles[94], 3),
+                  'p99_ms': round(percentiles[98], 3),
+                  'queries': queries, 'bytes': size}
+        self.stdout.write(f'{name:>28}: p50={result["p50_ms"]:.2f}ms '
+                          f'p95={result["p95_ms"]:.2f}ms '
+                          f'queries={queries} bytes={size}')
+        return result
+
+    @staticmethod
+    def request(name, client, steps):
+        queries = size = 0
+        for method, path, data, status in steps:
+            if callable(data):
+                data = data()
+            with CaptureQueriesContext(connection) as context:
+                response = getattr(client, method)(path, data, format='json')
+                # потоковый ответ выполняет запросы при чтении тела
+                content = (b''.join(response) if response.streaming
+                           else response.content)
+            if response.status_code != status:
+                raise CommandError(f'{name}: {method.upper()} {path} '
+                                   f'returned {response.status_code}: '
+                                   f'{getattr(response, "data", "")}')
+            queries += len(context)
+            size += len(content)
+        return queries, size
+
+    def save(self, path, run, merge):
+        """Запись базовой линии; частичный прогон дополняет прежнюю."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if merge and path.exists():
+            saved = json.loads(path.read_text())
+            run['endpoints'] = {**saved['endpoints'], **run['endpoints']}
+        path.write_text(json.dumps(run, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Baseline saved to {path}'))
+
+    def compare(self, path, run, options):
+        if not path.exists():
+            raise CommandError(f'No baseline at {path}, run with --save '
+                               'first')
+        baseline = json.loads(path.read_text())
+        if baseline['dataset'] != run['dataset']:
+            raise CommandError(
+                f'Baseline was recorded on another dataset: '
+                f'{baseline["dataset"]}, current is {run["dataset"]}')
+        failures = []
+        for name, result in run['endpoints'].items():
+            if name in baseline['endpoints']:
+                failures += self.regressions(
+                    name, baseline['endpoints'][name], result, options)
+        if failures:
+            raise CommandError('Performance regressions:\n'
+                               + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f'No regressions against {path}'))
+
+    @staticmethod
+    def regressions(name, old, new, options):
+        limit = 1 + options['threshold']
+        failures = []
+        if new['queries'] > old['queries']:
+            failures.append(f'{name}: {new["queries"]} queries, '
+                            f'baseline {old["queries"]}')
+        for key in LATENCY_KEYS:
+            if (new[key] > old[key] * limit
+                    and new[key] - old[key] > options['min_delta_ms']):
+                failures.append(f'{name}: {key} {new[key]:.2f}, '
+                                f'baseline {old[key]:.2f}')
+        if new['bytes'] > old['bytes'] * limit:
+            failures.append(f'{name}: {new["bytes"]} bytes, '
+                            f'baseline {old["bytes"]}')
+        return failures
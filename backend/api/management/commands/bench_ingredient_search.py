@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.search import search_ingredients
+from api.versions import bump_versions
+from recipes.models import Ingredient
+from recipes.utils import normalize_name
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'по вкусу')
+
+
+class Command(BaseCommand):
+    help = ('Compare ingredient autocomplete latency (p50/p99) of the '
+            'icontains filter and the ranked search on a synthetic catalog. '
+            'All generated rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100_000,
+                            help='Catalog size (default: 100000)')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of timed queries (default: 200)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            words = self.fill_catalog(options['size'], rng)
+            bump_versions('ingredients')
+            terms = [rng.choice(words)[:rng.randint(1, 5)]
+                     for _ in range(options['queries'])]
+            self.report('icontains', terms, lambda term: list(
+                Ingredient.objects.filter(name__icontains=term)))
+            self.report('ranked search', terms, lambda term: list(
+                search_ingredients(Ingredient.objects.all(), term)))
+            transaction.set_rollback(True)
+        bump_versions('ingredients')
+
+    @staticmethod
+    def fill_catalog(size, rng):
+        words = sorted({word for name in Ingredient.objects.values_list(
+            'name', flat=True) for word in name.split() if len(word) > 2})
+        if not words:
+            words = ['молоко', 'мука', 'сахар', 'соль', 'яйцо', 'масло']
+        missing = size - Ingredient.objects.count()
+        batch = []
+        for number in range(max(missing, 0)):
+            name = f'{" ".join(rng.sample(words, 2))} {number}'
+            batch.append(Ingredient(
+                name=name, search_name=normalize_name(name),
+                measurement_unit=rng.choice(UNITS)))
+            if len(batch) == 5000:
+                Ingredient.objects.bulk_create(batch)
+                batch = []
+        Ingredient.objects.bulk_create(batch)
+        return words
+
+    def report(self, label, terms, run):
+        run(terms[0])
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            run(term)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(f'{label:>14}: p50={percentiles[49]:.2f}ms '
+                          f'p99={percentiles[98]:.2f}ms')
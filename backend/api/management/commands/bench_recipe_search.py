@@ -0,0 +1,95 @@
+import random
+import statistics
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from api.search import search_recipes
+from recipes.models import Recipe
+from recipes.search import index_search_words, uses_search_vector
+from users.models import User
+
+SYLLABLES = ('ба', 'ве', 'го', 'да', 'жи', 'зо', 'ка', 'ле', 'ми', 'но',
+             'пу', 'ро', 'са', 'ти', 'фу', 'ха', 'це', 'ша', 'ю', 'я')
+VOCABULARY_SIZE = 20_000
+
+
+class Command(BaseCommand):
+    help = ('Compare recipe search latency (p50/p99) of icontains on '
+            'name/text and the full-text search on a synthetic dataset. '
+            'All generated rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000,
+                            help='Number of recipes (default: 1000000)')
+        parser.add_argument('--queries', type=int, default=100,
+                            help='Number of timed queries (default: 100)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = self.vocabulary(rng)
+        weights = list(accumulate(1 / rank
+                                  for rank in range(1, len(words) + 1)))
+
+        def sample(k):
+            return rng.choices(words, cum_weights=weights, k=k)
+
+        backend = ('tsvector' if uses_search_vector(connection.alias)
+                   else 'word index')
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.fill_recipes(options['size'], options['batch_size'],
+                              sample)
+            self.stdout.write(f'Generated {options["size"]} recipes in '
+                              f'{time.perf_counter() - started:.1f}s')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE recipes_recipe')
+            terms = [' '.join(sample(rng.randint(1, 2)))
+                     for _ in range(options['queries'])]
+            self.report('icontains', terms, lambda term: list(
+                Recipe.objects.filter(
+                    Q(name__icontains=term) | Q(text__icontains=term))
+                .order_by('-created_at', '-id')[:6]))
+            self.report(backend, terms, lambda term: list(
+                search_recipes(Recipe.objects.all(), term)[:6]))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def vocabulary(rng):
+        """Словарь с частотами по закону Ципфа, как в живых текстах."""
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+        words = sorted(words)
+        rng.shuffle(words)
+        return words
+
+    @staticmethod
+    def fill_recipes(size, batch_size, sample):
+        author = User.objects.create(username='bench_search',
+                                     email='bench_search@example.com')
+        for start in range(0, size, batch_size):
+            recipes = Recipe.objects.bulk_create([
+                Recipe(author=author,
+                       name=f'{" ".join(sample(2))} {number}',
+                       text=' '.join(sample(12)),
+                       cooking_time=1, image='recipes/images/bench.png')
+                for number in range(start, min(start + batch_size, size))])
+            index_search_words(recipes, replace=False)
+
+    def report(self, label, terms, run):
+        run(terms[0])
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            run(term)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(f'{label:>10}: p50={percentiles[49]:.2f}ms '
+                          f'p99={percentiles[98]:.2f}ms')
@@ -0,0 +1,129 @@
+import statistics
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers import RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
+from users.models import User
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class LegacyRecipeSerializer(RecipeSerializer):
+    """Прежнее обновление: удаление и повторная вставка всех связей."""
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('recipe_tag')
+        ingredients = validated_data.pop('recipe_ingredient')
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save()
+        instance.recipe_ingredient.all().delete()
+        instance.recipe_tag.all().delete()
+        self._related_data_save(instance, tags, ingredients)
+        return instance
+
+
+class Command(BaseCommand):
+    help = ('Compare write volume and latency of recipe updates: the old '
+            'delete-all/recreate strategy against diff-based updates. '
+            'Sample data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=20,
+                            help='Ingredients per recipe (default: 20)')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Timed requests per scenario (default: 50)')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options['ingredients'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def run(self, size, repeat):
+        author = User.objects.create(username='bench_author',
+                                     email='bench_author@example.com')
+        tags = list(Tag.objects.all()[:3]) or [
+            Tag.objects.create(name=f'bench {number}', slug=f'bench{number}')
+            for number in range(3)]
+        ingredients = list(Ingredient.objects.all()[:size + 1])
+        ingredients += [
+            Ingredient.objects.create(name=f'bench {number}',
+                                      measurement_unit='г')
+            for number in range(len(ingredients), size + 1)]
+        recipe = Recipe.objects.create(
+            author=author, name='bench', text='bench', cooking_time=1,
+            image='recipes/images/bench.png')
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag) for tag in tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients[:size])
+
+        def payload(step, vary_amount=False, swap=False):
+            used = ingredients[:size]
+            if swap and step % 2:
+                used = used[:-1] + ingredients[size:]
+            return {'name': 'bench', 'text': f'bench {step}',
+                    'cooking_time': 1,
+                    'tags': [tag.id for tag in tags],
+                    'ingredients': [
+                        {'id': item.id,
+                         'amount': 1 + step % 2 if vary_amount and not index
+                         else 1}
+                        for index, item in enumerate(used)]}
+
+        scenarios = (
+            ('new text', payload, True),
+            ('one amount', lambda step: payload(step, vary_amount=True),
+             True),
+            ('swap ingredient', lambda step: payload(step, swap=True), True),
+            ('text only', lambda step: {'text': f'bench {step}'}, False),
+        )
+        self.stdout.write(f'{"scenario":>16} {"strategy":>8} {"queries":>8} '
+                          f'{"insert":>7} {"update":>7} {"delete":>7} '
+                          f'{"p50 ms":>8}')
+        for label, make_payload, legacy in scenarios:
+            strategies = [('diff', RecipeSerializer)]
+            if legacy:
+                strategies.insert(0, ('legacy', LegacyRecipeSerializer))
+            for strategy, serializer_class in strategies:
+                self.report(label, strategy, serializer_class, author,
+                            recipe.pk, make_payload, repeat)
+
+    def report(self, label, strategy, serializer_class, author, pk,
+               make_payload, repeat):
+        view = RecipeViewSet.as_view({'patch': 'partial_update'},
+                                     serializer_class=serializer_class)
+        timings, statements = [], Counter()
+        for step in range(repeat + 1):
+            request = APIRequestFactory().patch(
+                f'/api/recipes/{pk}/', make_payload(step), format='json')
+            force_authenticate(request, user=author)
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = view(request, pk=pk)
+                response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{label}/{strategy} returned '
+                                   f'{response.status_code}: '
+                                   f'{response.data}')
+            if step == 1:
+                statements = Counter(
+                    query['sql'].split(None, 1)[0].upper()
+                    for query in context.captured_queries)
+                queries = len(context)
+        self.stdout.write(
+            f'{label:>16} {strategy:>8} {queries:>8} '
+            + ' '.join(f'{statements[kind]:>7}' for kind in WRITES)
+            + f' {statistics.median(timings[1:]):>8.2f}')
@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from recipes import constants
+from recipes.models import Recipe
+from recipes.utils import encode_short_url
+from users.models import User
+
+
+def legacy_short_url():
+    """Прежний генератор: случайный код с проверкой занятости."""
+    while True:
+        short_url = ''.join(
+            random.choices(constants.SYMBOLS_FOR_SHORT_URL,
+                           k=constants.MAX_LENGTH_SHORT_URL))
+        if not Recipe.objects.filter(short_url=short_url).exists():
+            return short_url
+
+
+class Command(BaseCommand):
+    help = ('Measure recipe create throughput with the legacy random short '
+            'links and the deterministic encoder on a table of --size '
+            'recipes. All generated rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000)
+        parser.add_argument('--creates', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = User.objects.create(username='bench_short_links',
+                                         email='bench_short_links@example.com')
+            self.fill(author, options['size'])
+            for label, short_url in (('legacy probe', legacy_short_url),
+                                     ('encoded id', lambda: None)):
+                self.report(label, author, options['creates'], short_url)
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def fill(author, size):
+        """Вставка рецептов с заранее заданными id и ссылками."""
+        next_pk = (Recipe.objects.aggregate(max_pk=Max('pk'))['max_pk']
+                   or 0) + 1
+        missing = size - Recipe.objects.count()
+        batch_size = 5000
+        for offset in range(0, max(missing, 0), batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(pk=pk, author=author, name=f'bench {pk}',
+                       text='bench', cooking_time=1,
+                       short_url=encode_short_url(pk))
+                for pk in range(next_pk + offset,
+                                next_pk + min(offset + batch_size, missing)))
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                         [Recipe]):
+                cursor.execute(sql)
+
+    def report(self, label, author, creates, short_url):
+        started = time.perf_counter()
+        for number in range(creates):
+            Recipe(author=author, name=f'{label} {number}', text='bench',
+                   cooking_time=1, short_url=short_url()).save()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:>12}: {creates / elapsed:.0f} creates/s '
+                          f'({elapsed * 1000 / creates:.3f} ms per recipe)')
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from recipes.models import Recipe, RecipeTag, Tag
+from recipes.utils import tags_mask
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Compare feed latency (first page plus COUNT) of the join-based '
+            'tag filter and the tag bitmask filter. All generated rows are '
+            'rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100_000,
+                            help='Number of recipes (default: 100000)')
+        parser.add_argument('--repeat', type=int, default=30,
+                            help='Timed runs per filter (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            tags = self.fill_recipes(options['size'], options['batch_size'],
+                                     rng)
+            feed = Recipe.objects.order_by('-created_at', '-id')
+            self.report('unfiltered', feed, options['repeat'])
+            for count in range(1, len(tags) + 1):
+                selected = tags[:count]
+                mask = tags_mask(tag.bit for tag in selected)
+                masked = feed.alias(
+                    selected_tags=F('tags_mask').bitand(mask))
+                self.compare(f'any of {count}',
+                             feed.filter(tag__in=selected).distinct(),
+                             masked.filter(selected_tags__gt=0),
+                             options['repeat'])
+                joined = feed
+                for tag in selected:
+                    joined = joined.filter(tag=tag)
+                self.compare(f'all of {count}', joined,
+                             masked.filter(selected_tags=mask),
+                             options['repeat'])
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def fill_recipes(size, batch_size, rng):
+        tags = list(Tag.objects.exclude(bit=None)[:3])
+        tags += [Tag.objects.create(name=f'bench {number}',
+                                    slug=f'bench{number}')
+                 for number in range(len(tags), 3)]
+        author = User.objects.create(username='bench_tags',
+                                     email='bench_tags@example.com')
+        for start in range(0, size, batch_size):
+            chosen = [rng.sample(tags, rng.randint(1, len(tags)))
+                      for _ in range(start, min(start + batch_size, size))]
+            recipes = Recipe.objects.bulk_create([
+                Recipe(author=author, name=f'bench {start + number}',
+                       text='bench', cooking_time=1,
+                       image='recipes/images/bench.png',
+                       tags_mask=tags_mask(tag.bit for tag in recipe_tags))
+                for number, recipe_tags in enumerate(chosen)])
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe=recipe, tag=tag)
+                for recipe, recipe_tags in zip(recipes, chosen)
+                for tag in recipe_tags])
+        return tags
+
+    def compare(self, label, joined, masked, repeat):
+        if (list(joined.values_list('id', flat=True)[:50])
+                != list(masked.values_list('id', flat=True)[:50])):
+            raise CommandError(f'{label}: filters return different pages')
+        self.report(f'{label} join', joined, repeat)
+        self.report(f'{label} mask', masked, repeat)
+
+    def report(self, label, queryset, repeat):
+        timings = []
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:6])
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f'{label:>16}: '
+                          f'p50={statistics.median(timings[1:]):.2f}ms')
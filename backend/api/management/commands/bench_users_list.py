@@ -0,0 +1,95 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the users list, user detail and subscriptions with '
+            'prolific authors: latency, query count and peak Python memory '
+            'per request. Authors with --recipes recipes each and their '
+            'subscriber are generated and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=6,
+                            help='Number of authors (default: 6)')
+        parser.add_argument('--recipes', type=int, default=10_000,
+                            help='Recipes per author (default: 10000)')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Timed runs per endpoint (default: 10)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        if options['authors'] < 1 or options['repeat'] < 1:
+            raise CommandError('--authors and --repeat must be positive')
+        with transaction.atomic():
+            authors, subscriber = self.fill(options['authors'],
+                                            options['recipes'],
+                                            options['batch_size'])
+            limit = len(authors)
+            steps = (
+                ('users-list', None, f'/api/users/?limit={limit}&cursor='),
+                ('users-list-authenticated', subscriber,
+                 f'/api/users/?limit={limit}&cursor='),
+                ('user-detail', None, f'/api/users/{authors[0].pk}/'),
+                ('subscriptions', subscriber,
+                 f'/api/users/subscriptions/?limit={limit}&recipes_limit=3'),
+            )
+            for name, user, path in steps:
+                self.measure(name, user, path, options['repeat'])
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def fill(authors, recipes, batch_size):
+        """Новые авторы первыми попадают в список по курсору."""
+        created = []
+        for number in range(authors):
+            author = User.objects.create(
+                username=f'bench_author{number}',
+                email=f'bench_author{number}@example.com',
+                recipes_count=recipes)
+            for start in range(0, recipes, batch_size):
+                Recipe.objects.bulk_create([
+                    Recipe(author=author, name=f'bench {index}',
+                           text='bench', cooking_time=1,
+                           image='recipes/images/bench.png')
+                    for index in range(start, min(start + batch_size,
+                                                  recipes))])
+            created.append(author)
+        subscriber = User.objects.create(username='bench_subscriber',
+                                         email='bench_subscriber@example.com')
+        Follow.objects.bulk_create([Follow(user=subscriber, following=author)
+                                    for author in created])
+        return created, subscriber
+
+    def measure(self, name, user, path, repeat):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{name}: GET {path} returned '
+                                   f'{response.status_code}')
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                client.get(path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stdout.write(f'{name:>24}: '
+                          f'p50={statistics.median(timings):.2f}ms '
+                          f'queries={len(context)} '
+                          f'peak={peak / 2 ** 20:.1f}MiB')
@@ -0,0 +1,89 @@
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.middleware import DatabaseRoutingMiddleware
+from foodgram.db_router import replicas
+from recipes.models import Recipe
+from users.models import User
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+
+class Command(BaseCommand):
+    help = ('Check which databases serve API requests: safe requests read '
+            'from replicas, writes go to the primary, and the writing '
+            'client reads from the primary for REPLICA_PIN_SECONDS. Needs '
+            'replicas in DB_REPLICAS; locally two SQLite files will do, '
+            'e.g. SQLITE_PATH=db.sqlite3 DB_REPLICAS=replica.sqlite3 with '
+            'the replica copied from the primary. Writes are rolled back.')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError('No replicas configured, set DB_REPLICAS')
+        user = User.objects.filter(is_active=True).order_by('pk').first()
+        recipe = (Recipe.objects.exclude(favorites__user=user)
+                  .order_by('pk').first())
+        if recipe is None:
+            raise CommandError('No data to check, run generate_dataset '
+                               'first')
+        with transaction.atomic():
+            token, _ = Token.objects.get_or_create(user=user)
+            try:
+                failures = self.check_routing(token.key, recipe)
+            finally:
+                token_cache.delete(token.key)
+                cache.delete(DatabaseRoutingMiddleware.pin_key(
+                    f'Token {token.key}'))
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Requests are routed as '
+                                             'expected'))
+
+    def check_routing(self, key, recipe):
+        headers = {'Authorization': f'Token {key}'}
+        browser = Client(headers=headers)
+        steps = (
+            ('anonymous read', Client(), 'get', '/api/tags/', REPLICA),
+            ('write', browser, 'post', f'/api/recipes/{recipe.pk}/favorite/',
+             PRIMARY),
+            ('read after write', browser, 'get', '/api/recipes/?limit=1',
+             PRIMARY),
+            ('read after write, no cookie', Client(headers=headers), 'get',
+             f'/api/recipes/{recipe.pk}/', PRIMARY),
+            ('anonymous read after write', Client(), 'get',
+             f'/api/recipes/{recipe.pk}/', REPLICA),
+        )
+        failures = []
+        for name, client, method, path, expected in steps:
+            databases = self.databases(client, method, path)
+            used = ', '.join(sorted(databases)) or 'no queries'
+            self.stdout.write(f'{name}: {method.upper()} {path} -> {used}')
+            if databases != {expected}:
+                failures.append(f'{name} should use only the {expected}, '
+                                f'used {sorted(databases)}')
+        return failures
+
+    @staticmethod
+    def databases(client, method, path):
+        """Виды баз (основная, реплика), получившие запросы."""
+        with ExitStack() as stack:
+            contexts = {
+                alias: stack.enter_context(
+                    CaptureQueriesContext(connections[alias]))
+                for alias in connections}
+            response = getattr(client, method)(path)
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {path} returned '
+                                   f'{response.status_code}')
+        return {PRIMARY if alias == DEFAULT_DB_ALIAS else REPLICA
+                for alias, context in contexts.items() if len(context)}
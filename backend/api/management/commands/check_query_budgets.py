@@ -0,0 +1,129 @@
+import base64
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.constants import QUERY_BUDGETS
+from api.pagination import LimitPageNumberPagination
+from api.views import RecipeViewSet
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Fail if the recipe read endpoints exceed their query budgets '
+            'or issue more queries as the page grows. Sample data is '
+            'rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(1, 6, 30),
+            help='Number of recipes to render per list page')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            failures = self.check_budgets(sorted(options['sizes']))
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All query budgets are met'))
+
+    def check_budgets(self, sizes):
+        author = User.objects.create(username='budget_author',
+                                     email='budget_author@example.com')
+        reader = User.objects.create(username='budget_reader',
+                                     email='budget_reader@example.com')
+        failures = []
+        for user in (None, reader):
+            Recipe.objects.filter(author=author).delete()
+            counts = []
+            for size in sizes:
+                self.create_recipes(author, size)
+                counts.append(self.count_queries(
+                    'list', user, {'limit': size, 'author': author.id}))
+            detail = self.count_queries(
+                'retrieve', user, pk=Recipe.objects.filter(
+                    author=author).values_list('id', flat=True).first())
+            kind = 'anonymous' if user is None else 'authenticated'
+            failures += self.compare(f'recipe-list-{kind}', counts)
+            failures += self.compare(f'recipe-detail-{kind}', [detail])
+        failures += self.compare('recipe-create', [
+            self.count_create_queries(reader, size) for size in sizes])
+        return failures
+
+    def compare(self, name, counts):
+        budget = QUERY_BUDGETS[name]
+        self.stdout.write(f'{name}: {counts} queries (budget {budget})')
+        if max(counts) > budget:
+            return [f'{name} runs {max(counts)} queries, '
+                    f'budget is {budget}']
+        if len(set(counts)) > 1:
+            return [f'{name} query count depends on page size: {counts}']
+        return []
+
+    @staticmethod
+    def create_recipes(author, total):
+        tags = list(Tag.objects.all()[:3]) or [
+            Tag.objects.create(name='budget', slug='budget')]
+        ingredients = list(Ingredient.objects.all()[:5]) or [
+            Ingredient.objects.create(name='budget', measurement_unit='г')]
+        start = Recipe.objects.filter(author=author).count()
+        for number in range(start, total):
+            recipe = Recipe.objects.create(
+                author=author, name=f'budget {number}', text='budget',
+                cooking_time=1, image='recipes/images/budget.png')
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for ingredient in ingredients)
+
+    @staticmethod
+    def count_create_queries(user, size):
+        image = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(image, 'PNG')
+        ingredients = list(Ingredient.objects.all()[:size])
+        ingredients += [
+            Ingredient.objects.create(name=f'budget {number}',
+                                      measurement_unit='г')
+            for number in range(len(ingredients), size)]
+        request = APIRequestFactory().post('/api/recipes/', {
+            'name': f'budget create {size}', 'text': 'budget',
+            'cooking_time': 1,
+            'image': ('data:image/png;base64,'
+                      + base64.b64encode(image.getvalue()).decode()),
+            'tags': list(Tag.objects.values_list('id', flat=True)[:3]),
+            'ingredients': [{'id': ingredient.id, 'amount': 1}
+                            for ingredient in ingredients],
+        }, format='json')
+        force_authenticate(request, user=user)
+        view = RecipeViewSet.as_view({'post': 'create'})
+        with CaptureQueriesContext(connection) as context:
+            response = view(request)
+            response.render()
+        if response.status_code != 201:
+            raise CommandError(f'recipe create returned '
+                               f'{response.status_code}: {response.data}')
+        return len(context)
+
+    @staticmethod
+    def count_queries(action, user, params=None, **kwargs):
+        request = APIRequestFactory().get('/api/recipes/', params)
+        if user is not None:
+            force_authenticate(request, user=user)
+        view = RecipeViewSet.as_view(
+            {'get': action}, pagination_class=LimitPageNumberPagination)
+        with CaptureQueriesContext(connection) as context:
+            response = view(request, **kwargs)
+            response.render()
+        if response.status_code != 200:
+            raise CommandError(f'recipe {action} returned '
+                               f'{response.status_code}')
+        return len(context)
@@ -0,0 +1,31 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping_list import differences
+
+SHOWN_DIFFERENCES = 20
+
+
+class Command(BaseCommand):
+    help = ('Compare the materialized shopping lists with the totals '
+            'computed from shopping carts and recipe ingredients and fail '
+            'if they drifted. Repair with rebuild_shopping_lists.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', metavar='ID',
+                            help='Check only these users')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        drifted = list(differences(options['users'], options['batch_size']))
+        for user_id, ingredient_id, expected, stored in islice(
+                drifted, SHOWN_DIFFERENCES):
+            self.stdout.write(f'user {user_id}, ingredient {ingredient_id}: '
+                              f'expected {expected}, stored {stored}')
+        if drifted:
+            users = len({user_id for user_id, *_ in drifted})
+            raise CommandError(
+                f'{len(drifted)} shopping list rows of {users} users '
+                f'drifted, run rebuild_shopping_lists')
+        self.stdout.write(self.style.SUCCESS('Shopping lists are consistent'))
@@ -0,0 +1,101 @@
+import base64
+import io
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache
+from api.middleware import DatabaseRoutingMiddleware
+from users.models import Follow, User
+
+COUNTERS = ('recipes_count', 'followers_count')
+
+
+class Command(BaseCommand):
+    help = ('Check that a user served from the token cache does not write '
+            'stale counters back: a follower subscribes to the user, then '
+            'the user changes the avatar and the profile through the API '
+            'and the counters must stay as they are. Writes are rolled '
+            'back.')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(is_active=True).order_by('pk')[:2])
+        if len(users) < 2:
+            raise CommandError('No data to check, run generate_dataset '
+                               'first')
+        user, follower = users
+        avatars = []
+        with transaction.atomic():
+            Follow.objects.filter(user=follower, following=user).delete()
+            token, _ = Token.objects.get_or_create(user=user)
+            try:
+                failures = self.check_counters(token.key, user, follower,
+                                               avatars)
+            finally:
+                token_cache.delete(token.key)
+                cache.delete(DatabaseRoutingMiddleware.pin_key(
+                    f'Token {token.key}'))
+            transaction.set_rollback(True)
+        for name in avatars:
+            User.avatar.field.storage.delete(name)
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Cached users keep counters '
+                                             'intact'))
+
+    def check_counters(self, key, user, follower, avatars):
+        client = Client(headers={'Authorization': f'Token {key}'})
+        # пользователь попадает в кеш токенов до подписки на него
+        self.request(client, 'get', '/api/users/me/', 200)
+        subscriber = APIClient()
+        subscriber.force_authenticate(follower)
+        self.request(subscriber, 'post', f'/api/users/{user.pk}/subscribe/',
+                     201)
+        expected = self.counters(user)
+        steps = (
+            ('PUT avatar', 'put', '/api/users/me/avatar/',
+             {'avatar': self.image()}, 200),
+            ('DELETE avatar', 'delete', '/api/users/me/avatar/', None, 204),
+            ('PATCH profile', 'patch', '/api/users/me/',
+             {'first_name': 'Проверка'}, 200),
+        )
+        failures = []
+        for name, method, path, data, status in steps:
+            self.request(client, method, path, status, data)
+            avatar = User.objects.values_list('avatar', flat=True).get(
+                pk=user.pk)
+            if avatar:
+                avatars.append(avatar)
+            counters = self.counters(user)
+            self.stdout.write(f'{name}: {counters}')
+            if counters != expected:
+                failures.append(f'{name} changed counters {expected} to '
+                                f'{counters}')
+        return failures
+
+    @staticmethod
+    def counters(user):
+        return dict(zip(COUNTERS, User.objects.values_list(*COUNTERS).get(
+            pk=user.pk)))
+
+    @staticmethod
+    def request(client, method, path, status, data=None):
+        response = getattr(client, method)(
+            path, data, content_type='application/json')
+        if response.status_code != status:
+            raise CommandError(f'{method.upper()} {path} returned '
+                               f'{response.status_code}')
+
+    @staticmethod
+    def image():
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+        return ('data:image/png;base64,'
+                + base64.b64encode(buffer.getvalue()).decode())
@@ -0,0 +1,305 @@
+import csv
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes import constants
+from recipes.models import (Favorite, Ingredient, PurchaseUser, Recipe,
+                            RecipeIngredient, RecipeSearchWord, RecipeTag,
+                            ShoppingListItem, Tag)
+from recipes.search import uses_search_vector, word_weights
+from recipes.shopping_list import rebuild as rebuild_shopping_lists
+from recipes.utils import encode_short_url, tags_mask
+from users.models import Follow, User
+
+POWER_LAW_EXPONENT = 1.1
+DRAW_CHUNK = 100_000
+TIME_SPAN = timedelta(days=365)
+IMAGE = 'recipes/images/seed.jpg'
+DEFAULT_TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+                ('Ужин', 'dinner'))
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей', 'Юлия', 'Михаил')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов')
+DISHES = ('Салат', 'Суп', 'Пирог', 'Запеканка', 'Рагу', 'Омлет', 'Паста',
+          'Каша', 'Соус', 'Десерт')
+STEPS = ('Нарежьте {}.', 'Добавьте {}.', 'Обжарьте {} до золотистого цвета.',
+         'Смешайте {} с остальными продуктами.',
+         'Доведите до кипения и положите {}.', 'Посыпьте блюдо: {}.')
+USER_FIELDS = ('id', 'password', 'last_login', 'is_superuser', 'username',
+               'first_name', 'last_name', 'email', 'is_staff', 'is_active',
+               'date_joined', 'avatar', 'recipes_count', 'followers_count')
+RECIPE_FIELDS = ('id', 'name', 'text', 'author', 'image', 'cooking_time',
+                 'short_url', 'created_at', 'favorites_count',
+                 'purchases_count', 'tags_mask')
+
+
+def insert_rows(model, fields, rows):
+    """Вставка кортежей в таблицу модели в обход ORM.
+
+    На PostgreSQL строки передаются через COPY, на прочих базах одним
+    executemany. Сигналы не отправляются, счетчики заполняет вызывающий.
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(model._meta.get_field(field).column)
+                        for field in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN '
+                               'WITH (FORMAT csv)', buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) '
+                               f'VALUES ({placeholders})', rows)
+
+
+class Command(BaseCommand):
+    help = ('Generate a reproducible synthetic dataset: users, recipes with '
+            'tags and ingredients, favorites, shopping carts and follows '
+            'with power-law popularity. Rows are written with COPY on '
+            'PostgreSQL and batched INSERTs elsewhere, denormalized '
+            'counters, tag masks and shopping lists are filled in '
+            'directly. Run import_csv first to load ingredients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--favorites', type=int, default=100_000)
+        parser.add_argument('--carts', type=int, default=10_000,
+                            help='Number of shopping cart entries')
+        parser.add_argument('--follows', type=int, default=20_000)
+        parser.add_argument('--batch-size', type=int, default=10_000,
+                            help='Rows per COPY/INSERT (default: 10000)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='foodgram-seed',
+                            help='Password of every generated user')
+
+    def handle(self, *args, **options):
+        self.check_options(options)
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.index_words = not uses_search_vector(connection.alias)
+        ingredients = list(Ingredient.objects.order_by('pk')
+                           .values_list('pk', 'name'))
+        if not ingredients:
+            raise CommandError('No ingredients, run import_csv first')
+        self.ensure_image()
+        started = time.perf_counter()
+        with transaction.atomic():
+            tags = self.get_tags()
+            self.first_user = self.next_pk(User)
+            self.first_recipe = self.next_pk(Recipe)
+            self.generate(options, tags, ingredients)
+            self.reset_sequences()
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset generated in {time.perf_counter() - started:.1f}s'))
+
+    @staticmethod
+    def check_options(options):
+        users, recipes = options['users'], options['recipes']
+        if min(users, options['batch_size']) < 1 or recipes < 0:
+            raise CommandError('--users and --batch-size must be positive')
+        limits = (('favorites', recipes * users),
+                  ('carts', recipes * users),
+                  ('follows', users * (users - 1)))
+        for name, limit in limits:
+            if not 0 <= options[name] <= limit:
+                raise CommandError(f'--{name} must be between 0 and {limit}')
+
+    def generate(self, options, tags, ingredients):
+        users, recipes = options['users'], options['recipes']
+        # Популярные авторы пишут больше рецептов и чаще на них подписаны.
+        popularity = self.popularity(users)
+        authors = self.rng.choices(range(users), k=recipes,
+                                   cum_weights=popularity)
+        recipes_count = [0] * users
+        for author in authors:
+            recipes_count[author] += 1
+        followers_count = self.degrees(options['follows'], users - 1,
+                                       popularity)
+        favorites = self.degrees(options['favorites'], users,
+                                 self.popularity(recipes))
+        carts = self.degrees(options['carts'], users,
+                             self.popularity(recipes))
+        self.timed(User, self.write_users, options['password'],
+                   recipes_count, followers_count)
+        self.timed(Recipe, self.write_recipes, authors, favorites, carts,
+                   tags, ingredients)
+        self.timed(Favorite, self.write_pairs, Favorite, ('user', 'recipe'),
+                   favorites, users)
+        self.timed(PurchaseUser, self.write_pairs, PurchaseUser,
+                   ('user', 'purchase'), carts, users)
+        self.timed(ShoppingListItem, rebuild_shopping_lists,
+                   range(self.first_user, self.first_user + users))
+        self.timed(Follow, self.write_follows, followers_count)
+
+    def timed(self, model, write, *args):
+        started = time.perf_counter()
+        total = write(*args)
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(f'{model._meta.db_table}: {total} rows in '
+                          f'{elapsed:.1f}s ({rate:.0f} rows/s)')
+
+    def popularity(self, size):
+        """Накопленные веса закона Ципфа в случайном порядке элементов."""
+        ranks = list(range(1, size + 1))
+        self.rng.shuffle(ranks)
+        return list(accumulate(rank ** -POWER_LAW_EXPONENT for rank in ranks))
+
+    def degrees(self, total, cap, weights):
+        """Число связей каждого элемента, не больше cap на элемент."""
+        size = len(weights)
+        degrees = [0] * size
+        while total:
+            for index in self.rng.choices(range(size), cum_weights=weights,
+                                          k=min(total, DRAW_CHUNK)):
+                if degrees[index] < cap:
+                    degrees[index] += 1
+                    total -= 1
+        return degrees
+
+    def write_users(self, password, recipes_count, followers_count):
+        password = make_password(password)
+        step = TIME_SPAN / max(len(recipes_count), 1)
+        date_joined = self.now - TIME_SPAN
+        rows = []
+        for index, counts in enumerate(zip(recipes_count, followers_count)):
+            pk = self.first_user + index
+            rows.append((
+                pk, password, None, False, f'seed{pk}',
+                self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+                f'seed{pk}@example.com', False, True,
+                self.datetime(date_joined + step * index), None, *counts))
+        self.write(User, USER_FIELDS, iter(rows))
+        return len(rows)
+
+    def write_recipes(self, authors, favorites, carts, tags, ingredients):
+        """Рецепты пачками вместе с тегами, ингредиентами и словами."""
+        weights = self.popularity(len(ingredients))
+        step = TIME_SPAN / max(len(authors), 1)
+        for start in range(0, len(authors), self.batch_size):
+            batch = {Recipe: [], RecipeTag: [], RecipeIngredient: [],
+                     RecipeSearchWord: []}
+            for index in range(start, min(start + self.batch_size,
+                                          len(authors))):
+                chosen = list(dict.fromkeys(self.rng.choices(
+                    ingredients, cum_weights=weights,
+                    k=self.rng.randint(3, 10))))
+                self.add_recipe(
+                    batch, self.first_recipe + index,
+                    self.first_user + authors[index],
+                    (favorites[index], carts[index]),
+                    self.rng.sample(tags, self.rng.randint(1, len(tags))),
+                    chosen, self.now - TIME_SPAN + step * index)
+            self.write_recipe_batch(batch)
+        return len(authors)
+
+    def add_recipe(self, batch, pk, author, counts, recipe_tags, chosen,
+                   created_at):
+        names = [name for _, name in chosen]
+        name = (f'{self.rng.choice(DISHES)}: '
+                f'{", ".join(names[:2])}')[:constants.MAX_LENGTH_NAME_RECIPE]
+        text = ' '.join(self.rng.choice(STEPS).format(name)
+                        for name in names)
+        batch[Recipe].append((
+            pk, name, text, author, IMAGE, self.rng.randint(5, 180),
+            encode_short_url(pk), self.datetime(created_at), *counts,
+            tags_mask(tag.bit for tag in recipe_tags)))
+        batch[RecipeTag] += [(pk, tag.pk) for tag in recipe_tags]
+        batch[RecipeIngredient] += [(pk, ingredient, self.rng.randint(1, 500))
+                                    for ingredient, _ in chosen]
+        if self.index_words:
+            batch[RecipeSearchWord] += [
+                (pk, word, weight)
+                for word, weight in word_weights(name, text).items()]
+
+    @staticmethod
+    def write_recipe_batch(batch):
+        insert_rows(Recipe, RECIPE_FIELDS, batch[Recipe])
+        insert_rows(RecipeTag, ('recipe', 'tag'), batch[RecipeTag])
+        insert_rows(RecipeIngredient, ('recipe', 'ingredient', 'amount'),
+                    batch[RecipeIngredient])
+        insert_rows(RecipeSearchWord, ('recipe', 'word', 'weight'),
+                    batch[RecipeSearchWord])
+
+    def write_pairs(self, model, fields, degrees, users):
+        """Избранное и покупки: у рецепта degree разных пользователей."""
+        rows = (
+            (self.first_user + user, self.first_recipe + index)
+            for index, degree in enumerate(degrees)
+            for user in self.rng.sample(range(users), degree))
+        return self.write(model, fields, rows)
+
+    def write_follows(self, followers_count):
+        """Подписки без подписок на себя: сдвиг номеров после автора."""
+        users = len(followers_count)
+        rows = (
+            (self.first_user + user + (user >= index),
+             self.first_user + index)
+            for index, degree in enumerate(followers_count)
+            for user in self.rng.sample(range(users - 1), degree))
+        return self.write(Follow, ('user', 'following'), rows)
+
+    def write(self, model, fields, rows):
+        total = 0
+        while batch := list(islice(rows, self.batch_size)):
+            insert_rows(model, fields, batch)
+            total += len(batch)
+        return total
+
+    @staticmethod
+    def datetime(value):
+        return connection.ops.adapt_datetimefield_value(value)
+
+    @staticmethod
+    def next_pk(model):
+        return (model._base_manager.aggregate(last=Max('pk'))['last']
+                or 0) + 1
+
+    @staticmethod
+    def get_tags():
+        tags = list(Tag.objects.exclude(bit=None))
+        if not tags:
+            tags = [Tag.objects.create(name=name, slug=slug)
+                    for name, slug in DEFAULT_TAGS]
+        return tags
+
+    @staticmethod
+    def ensure_image():
+        """Общая картинка всех сгенерированных рецептов."""
+        if default_storage.exists(IMAGE):
+            return
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 600), (230, 180, 120)).save(buffer, 'JPEG')
+        default_storage.save(IMAGE, ContentFile(buffer.getvalue()))
+
+    @staticmethod
+    def reset_sequences():
+        """Сдвиг последовательностей после вставки с явными id."""
+        statements = connection.ops.sequence_reset_sql(no_style(), [
+            User, Recipe, RecipeTag, RecipeIngredient, RecipeSearchWord,
+            Favorite, PurchaseUser, Follow])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.constants import AVATAR_IMAGE_VARIANTS, RECIPE_IMAGE_VARIANTS
+from recipes.images import render_targets, render_variants, variants_ready
+from recipes.models import Recipe
+from recipes.signals import mark_variants_ready
+from users.models import User
+
+SOURCES = (
+    (Recipe, 'image', RECIPE_IMAGE_VARIANTS),
+    (User, 'avatar', AVATAR_IMAGE_VARIANTS),
+)
+
+
+class Command(BaseCommand):
+    help = ('Render resized WebP/JPEG variants of recipe images and avatars '
+            'that do not have them yet and mark them as ready for the API')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Render variants even if they already exist')
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_WORKERS,
+            help='Number of worker processes (default: IMAGE_WORKERS)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        jobs = list(self.pending(options['force']))
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(render_variants, storage.path(name),
+                            render_targets(name, variants, storage)):
+                (model, name)
+                for model, name, variants, storage in jobs}
+            for future in as_completed(futures):
+                model, name = futures[future]
+                if future.exception() is not None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {future.exception()}')
+                else:
+                    mark_variants_ready(model, name)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered variants for {len(jobs) - failed} images, '
+            f'{failed} failed in {elapsed:.2f}s'))
+
+    @staticmethod
+    def pending(force):
+        """Изображения без копий; у готовых отмечается признак в модели."""
+        for model, field, variants in SOURCES:
+            names = (model._base_manager.exclude(**{field: ''})
+                     .exclude(**{f'{field}__isnull': True})
+                     .values_list(field, flat=True).order_by().distinct())
+            storage = model._meta.get_field(field).storage
+            for name in list(names.iterator()):
+                if force or not variants_ready(name, variants, storage):
+                    yield model, name, variants, storage
+                else:
+                    mark_variants_ready(model, name)
@@ -1,26 +1,102 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from api.versions import bump_versions
 from recipes.models import Ingredient
+from recipes.utils import normalize_name
+
+FIELDS = ('name', 'measurement_unit')
+FORMATS = ('csv', 'json', 'ndjson')
 
 
 class Command(BaseCommand):
-    help = 'Import data from CSV files into the database'
+    help = ('Import ingredients from CSV/JSON/NDJSON files into the database '
+            'with batched inserts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Files to import (default: data/ingredients.csv)')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Input format; detected from the file extension if omitted')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows per INSERT statement (default: 1000)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Parse and dedupe the input without writing to the database')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        paths = options['paths'] or [settings.BASE_DIR / 'data'
+                                     / 'ingredients.csv']
+        seen = set(Ingredient.objects.values_list(*FIELDS).iterator())
+        for path in map(Path, paths):
+            self.import_data(path, options['format'] or self.detect(path),
+                             seen, options['batch_size'], options['dry_run'])
+        if not options['dry_run']:
+            bump_versions('ingredients')
 
-    def handle(self, *args, **kwargs):
+    @staticmethod
+    def detect(path):
+        suffix = path.suffix.lstrip('.').lower()
+        if suffix == 'jsonl':
+            return 'ndjson'
+        if suffix not in FORMATS:
+            raise CommandError(f'Cannot detect format of {path}, '
+                               'use --format')
+        return suffix
 
-        data_dir = settings.BASE_DIR / 'data'
+    @staticmethod
+    def read_rows(file, file_format):
+        """Построчное чтение файла в виде словарей."""
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        elif file_format == 'ndjson':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(file)
 
-        self.import_data(data_dir / 'ingredients.csv',
-                         Ingredient, ['name', 'measurement_unit'])
+    @staticmethod
+    def new_objects(rows, seen, stats):
+        """Отбор строк, отсутствующих в базе и ранее в файле."""
+        for row in rows:
+            stats['rows'] += 1
+            key = tuple(str(row.get(field) or '').strip()
+                        for field in FIELDS)
+            if not all(key) or key in seen:
+                stats['skipped'] += 1
+                continue
+            seen.add(key)
+            stats['inserted'] += 1
+            yield Ingredient(search_name=normalize_name(key[0]),
+                             **dict(zip(FIELDS, key)))
 
-    def import_data(self, file_path, model, fields):
+    def import_data(self, file_path, file_format, seen, batch_size, dry_run):
+        stats = {'rows': 0, 'inserted': 0, 'skipped': 0}
+        started = time.perf_counter()
         with open(file_path, encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                data = {field: row[field] for field in fields}
-                model.objects.get_or_create(**data)
-        self.stdout.write(self.style.SUCCESS('Successfully loaded'
-                                             f'data from {file_path}'))
+            objects = self.new_objects(self.read_rows(file, file_format),
+                                       seen, stats)
+            while batch := list(islice(objects, batch_size)):
+                if not dry_run:
+                    Ingredient.objects.bulk_create(batch,
+                                                   ignore_conflicts=True)
+        elapsed = time.perf_counter() - started
+        rate = stats['rows'] / elapsed if elapsed else stats['rows']
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Loaded data from {file_path}: '
+            f'{stats["rows"]} rows, {stats["inserted"]} inserted, '
+            f'{stats["skipped"]} skipped in {elapsed:.2f}s '
+            f'({rate:.0f} rows/s)'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recalculate the materialized shopping lists (ingredient totals '
+            'per user) from shopping carts and recipe ingredients. Each '
+            'batch of users is rebuilt in its own transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', metavar='ID',
+                            help='Rebuild only these users')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild(options['users'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} shopping list rows written in '
+            f'{time.perf_counter() - started:.1f}s'))
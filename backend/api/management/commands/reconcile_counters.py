@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, PurchaseUser, Recipe, RecipeTag
+from users.models import Follow, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'purchases_count', PurchaseUser, 'purchase'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def actual_count(related_model, key):
+    return Coalesce(Subquery(
+        related_model._base_manager
+        .filter(**{key: OuterRef('pk')})
+        .order_by()
+        .values(key)
+        .annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = ('Recalculate denormalized favorite, shopping cart, recipe and '
+            'follower counters and recipe tag masks and repair the rows '
+            'that drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the number of drifted rows')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, related_model, key in COUNTERS:
+                count = actual_count(related_model, key)
+                drifted = (model._base_manager
+                           .annotate(actual=count)
+                           .exclude(**{field: F('actual')})
+                           .values('pk'))
+                total = drifted.count()
+                if total and not options['dry_run']:
+                    model._base_manager.filter(pk__in=drifted).update(
+                        **{field: count})
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: {total} drifted')
+            self.reconcile_tags_mask(options['dry_run'])
+        self.stdout.write(self.style.SUCCESS('Counters reconciled'))
+
+    def reconcile_tags_mask(self, dry_run):
+        masks = defaultdict(int)
+        for recipe_id, bit in (RecipeTag._base_manager.exclude(tag__bit=None)
+                               .values_list('recipe_id', 'tag__bit')
+                               .iterator()):
+            masks[recipe_id] |= 1 << bit
+        drifted = [
+            Recipe(pk=pk, tags_mask=masks[pk])
+            for pk, mask in Recipe._base_manager.values_list(
+                'pk', 'tags_mask').iterator()
+            if mask != masks[pk]]
+        if drifted and not dry_run:
+            Recipe._base_manager.bulk_update(drifted, ['tags_mask'],
+                                             batch_size=1000)
+        self.stdout.write(f'recipe.tags_mask: {len(drifted)} drifted')
@@ -0,0 +1,250 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+from . import constants
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Время и число запросов к базе в рамках одного HTTP-запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = 'unresolved'
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render_started = None
+        self.render = 0.0
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def record_query(execute, sql, params, many, context):
+    """Учет запроса к базе в метриках текущего HTTP-запроса.
+
+    Обертка ставится на каждое соединение при подключении, а метрики
+    берутся из контекста, поэтому учитываются и запросы async ORM,
+    выполняемые в потоках sync_to_async.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def timed_serializer(serializer):
+    """Учет времени сериализации ответа в метриках текущего запроса."""
+    to_representation = serializer.to_representation
+
+    def timed(instance):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return to_representation(instance)
+        started = time.perf_counter()
+        try:
+            return to_representation(instance)
+        finally:
+            metrics.serialize += time.perf_counter() - started
+
+    serializer.to_representation = timed
+    return serializer
+
+
+class LatencyRegistry:
+    """Гистограммы задержек по действиям в памяти процесса.
+
+    Каждый воркер периодически сбрасывает свой снимок в METRICS_DIR
+    под именем <pid>-<uuid процесса>.json, а /metrics складывает снимки
+    всех воркеров. Снимки завершившихся воркеров переносятся в общий
+    итог retired.json, чтобы счетчики не убывали.
+    """
+    buckets = constants.METRICS_BUCKETS
+    retired_name = 'retired.json'
+    lock_name = 'collect.lock'
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """Новый процесс, в том числе после fork, начинает с нуля.
+
+        Свой uuid не дает процессу с повторно выданным pid перезаписать
+        снимок прежнего.
+        """
+        self._lock = threading.Lock()
+        self._views = {}
+        self._flushed = 0.0
+        self._instance = uuid.uuid4().hex
+
+    def observe(self, metrics, duration):
+        with self._lock:
+            view = self._views.setdefault(metrics.view, {
+                'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0,
+                'count': 0, 'queries': 0, 'db': 0.0, 'serialize': 0.0})
+            position = next((index for index, bound in enumerate(self.buckets)
+                             if duration <= bound), len(self.buckets))
+            view['buckets'][position] += 1
+            view['sum'] += duration
+            view['count'] += 1
+            view['queries'] += metrics.queries
+            view['db'] += metrics.db
+            view['serialize'] += metrics.serialize
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._views))
+
+    def flush(self, force=False):
+        """Запись снимка процесса в общий каталог не чаще интервала."""
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and now - self._flushed < interval:
+            return
+        self._flushed = now
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.write(directory / f'{os.getpid()}-{self._instance}.json',
+                   self.snapshot())
+
+    @staticmethod
+    def write(path, data):
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(data))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def read(path):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for name, view in snapshot.items():
+                total = merged.setdefault(name, {
+                    key: ([0] * len(value) if key == 'buckets' else 0)
+                    for key, value in view.items()})
+                total['buckets'] = [a + b for a, b in zip(total['buckets'],
+                                                          view['buckets'])]
+                for key, value in view.items():
+                    if key != 'buckets':
+                        total[key] += value
+        return merged
+
+    @staticmethod
+    def alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def partition(self, directory):
+        """Снимки живых и завершившихся воркеров.
+
+        Из снимков с одним pid живому процессу принадлежит самый новый:
+        остальные оставлены процессами, чей pid выдан заново.
+        """
+        by_pid = {}
+        for path in directory.glob('*-*.json'):
+            try:
+                pid = int(path.stem.partition('-')[0])
+                by_pid.setdefault(pid, []).append((path.stat().st_mtime,
+                                                   path))
+            except (ValueError, OSError):
+                continue
+        live, dead = [], []
+        for pid, paths in by_pid.items():
+            paths = [path for _, path in sorted(paths)]
+            if self.alive(pid):
+                live.append(paths.pop())
+            dead += paths
+        return live, dead
+
+    def retire(self, directory, dead):
+        """Перенос снимков завершившихся воркеров в общий итог.
+
+        Итог хранит имена последних перенесенных снимков: если процесс
+        упадет после записи итога, но до удаления снимков, они не будут
+        учтены дважды.
+        """
+        path = directory / self.retired_name
+        retired = self.read(path) or {'snapshots': [], 'views': {}}
+        merged = [snapshot for snapshot in dead
+                  if snapshot.name not in retired['snapshots']]
+        if merged:
+            retired = {
+                'snapshots': [snapshot.name for snapshot in merged],
+                'views': self.merge([retired['views']] + [
+                    self.read(snapshot) or {} for snapshot in merged])}
+            self.write(path, retired)
+        for snapshot in dead:
+            snapshot.unlink(missing_ok=True)
+        return retired['views']
+
+    def collect(self):
+        """Сумма снимков всех воркеров, включая текущий и завершившиеся.
+
+        Сбор идет под блокировкой файла, чтобы одновременные запросы
+        /metrics не перенесли один снимок в итог дважды.
+        """
+        self.flush(force=True)
+        directory = Path(settings.METRICS_DIR)
+        with open(directory / self.lock_name, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            live, dead = self.partition(directory)
+            snapshots = [self.retire(directory, dead)]
+            snapshots += [self.read(path) or {} for path in live]
+        return self.merge(snapshots)
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        views = self.collect()
+        name = 'foodgram_request_duration_seconds'
+        lines = [f'# HELP {name} Request latency per API action.',
+                 f'# TYPE {name} histogram']
+        for view, data in sorted(views.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',),
+                                    data['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{{view="{view}"}} {data["sum"]}')
+            lines.append(f'{name}_count{{view="{view}"}} {data["count"]}')
+        for key, counter, help_text in constants.METRICS_COUNTERS:
+            lines += [f'# HELP {counter} {help_text}',
+                      f'# TYPE {counter} counter']
+            lines += [f'{counter}{{view="{view}"}} {data[key]}'
+                      for view, data in sorted(views.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = LatencyRegistry()
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import time
+import weakref
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import choose_replica, replicas, use_database
+
+from . import constants
+from .metrics import RequestMetrics, current_metrics, registry
+
+
+class ServerTimingMiddleware:
+    """Метрики запроса: число и время запросов к базе, сериализация.
+
+    Задержка учитывается в гистограмме действия DRF, а сотрудникам
+    разбивка времени возвращается в заголовке Server-Timing. Работает
+    и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # синхронные хуки Django под ASGI вызывал бы через поток
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(response, metrics,
+                           getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(response, metrics, await self.auser(request))
+
+    @staticmethod
+    async def auser(request):
+        """Пользователь без синхронного чтения сессии в цикле событий.
+
+        DRF подставляет в запрос уже найденного пользователя, а ленивый
+        пользователь сессии загружается асинхронно.
+        """
+        user = getattr(request, 'user', None)
+        if isinstance(user, SimpleLazyObject):
+            return await request.auser()
+        return user
+
+    @staticmethod
+    def finish(response, metrics, user):
+        if metrics.render_started is not None:
+            metrics.render = time.perf_counter() - metrics.render_started
+        total = time.perf_counter() - metrics.started
+        registry.observe(metrics, total)
+        registry.flush()
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_metrics.get().view = self.view_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        current_metrics.get().render_started = time.perf_counter()
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args,
+                            view_kwargs):
+        ServerTimingMiddleware.process_view(self, request, view_func,
+                                            view_args, view_kwargs)
+
+    async def aprocess_template_response(self, request, response):
+        return ServerTimingMiddleware.process_template_response(
+            self, request, response)
+
+    @staticmethod
+    def view_name(request, view_func):
+        """Имя действия: RecipeViewSet.list, short_link_redirect."""
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            return request.resolver_match.view_name
+        actions = getattr(view_func, 'actions', None) or {}
+        method = request.method.lower()
+        return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class ConcurrencyLimitMiddleware:
+    """Ограничение числа запросов, одновременно обрабатываемых воркером.
+
+    Под ASGI каждый запрос получает поток для синхронного кода Django
+    и свое соединение с базой, поэтому сверх ASGI_MAX_REQUESTS запросы
+    ждут очереди в цикле событий. Под WSGI воркер и так обрабатывает
+    запросы по одному.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.slots = weakref.WeakKeyDictionary()
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        loop = asyncio.get_running_loop()
+        if loop not in self.slots:
+            self.slots[loop] = asyncio.Semaphore(settings.ASGI_MAX_REQUESTS)
+        async with self.slots[loop]:
+            return await self.get_response(request)
+
+
+class DatabaseRoutingMiddleware:
+    """Чтение с реплик для безопасных методов, запись в основную базу.
+
+    Запросы на запись и читают, и пишут в основную базу. После
+    успешной записи клиент REPLICA_PIN_SECONDS секунд читает тоже
+    с основной базы, чтобы видеть свои изменения до того, как они
+    дойдут до реплик: метка ставится в cookie, а для клиентов без
+    cookie еще и в общий кеш по заголовку Authorization.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.enabled = bool(replicas())
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        pin_key = self.pin_key(request.headers.get('Authorization'))
+        pinned = (self.writes(request) or self.pinned_by_cookie(request)
+                  or (pin_key is not None
+                      and cache.get(pin_key) is not None))
+        with use_database(self.database(pinned)):
+            response = self.get_response(request)
+        if self.wrote(request, response):
+            self.pin(response)
+            if pin_key is not None:
+                cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        pin_key = self.pin_key(request.headers.get('Authorization'))
+        pinned = (self.writes(request) or self.pinned_by_cookie(request)
+                  or (pin_key is not None
+                      and await cache.aget(pin_key) is not None))
+        with use_database(self.database(pinned)):
+            response = await self.get_response(request)
+        if self.wrote(request, response):
+            self.pin(response)
+            if pin_key is not None:
+                await cache.aset(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    @staticmethod
+    def database(pinned):
+        return DEFAULT_DB_ALIAS if pinned else choose_replica()
+
+    @staticmethod
+    def writes(request):
+        return request.method not in SAFE_METHODS
+
+    @classmethod
+    def wrote(cls, request, response):
+        return cls.writes(request) and response.status_code < 400
+
+    @staticmethod
+    def pin_key(authorization):
+        """Ключ метки в кеше: хеш заголовка, сам токен в кеш не попадает."""
+        if not authorization:
+            return None
+        return constants.PRIMARY_PIN_KEY.format(
+            hashlib.sha256(authorization.encode()).hexdigest())
+
+    @staticmethod
+    def pinned_by_cookie(request):
+        try:
+            until = float(request.COOKIES.get(constants.PRIMARY_PIN_COOKIE,
+                                              0))
+        except ValueError:
+            return False
+        return until > time.time()
+
+    @staticmethod
+    def pin(response):
+        seconds = settings.REPLICA_PIN_SECONDS
+        response.set_cookie(constants.PRIMARY_PIN_COOKIE,
+                            str(time.time() + seconds), max_age=seconds,
+                            httponly=True, samesite='Lax')
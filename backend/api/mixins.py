@@ -0,0 +1,164 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from rest_framework.response import Response
+
+from .fieldsets import Fieldset, model_columns
+from .metrics import timed_serializer
+from .versions import aget_versions, get_versions, make_etag
+
+
+class AsyncReadMixin:
+    """Асинхронные list и retrieve на async ORM для работы под ASGI.
+
+    Вызываются из api.async_views.async_read_view вместо синхронных
+    действий; фильтры django-filter проверяют значения запросами
+    к базе, поэтому фильтрация выполняется в потоке. Так же в потоке
+    работают сериализаторы, которые сами обращаются к базе
+    (serialize_in_thread).
+    """
+    serialize_in_thread = False
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(
+                await self.aserializer_data(serializer))
+        serializer = self.get_serializer(
+            [instance async for instance in queryset], many=True)
+        return Response(await self.aserializer_data(serializer))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(await self.aserializer_data(
+            self.get_serializer(instance)))
+
+    async def aserializer_data(self, serializer):
+        if self.serialize_in_thread:
+            return await sync_to_async(lambda: serializer.data)()
+        return serializer.data
+
+    async def afilter_queryset(self, queryset):
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError,
+                ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы (ETag) по версиям данных.
+
+    Версии хранятся в общем кеше и обновляются сигналами моделей,
+    поэтому ответ 304 отдается до обращения к базе и сериализации.
+    Last-Modified не отдается: в нем только целые секунды, и после
+    двух изменений за одну секунду If-Modified-Since дал бы
+    устаревший ответ 304.
+    """
+    conditional_actions = ('list', 'retrieve')
+    version_names = ()
+    etag_per_user = False
+
+    def get_version_names(self):
+        return self.version_names
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request,
+                                         *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional_response(super().alist, request,
+                                                *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aconditional_response(super().aretrieve, request,
+                                                *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        etag = self.etag(request, get_versions(*self.get_version_names()))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return self.add_validators(response, etag)
+
+    async def aconditional_response(self, handler, request, *args,
+                                    **kwargs):
+        if self.action not in self.conditional_actions:
+            return await handler(request, *args, **kwargs)
+        etag = self.etag(request,
+                         await aget_versions(*self.get_version_names()))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return self.add_validators(response, etag)
+
+    def etag(self, request, versions):
+        user_id = request.user.pk if self.etag_per_user else None
+        return make_etag(versions, request.get_full_path(), user_id)
+
+    def add_validators(self, response, etag):
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        if self.etag_per_user:
+            patch_cache_control(response, private=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class TimedSerializerMixin:
+    """Время сериализации ответа учитывается в метриках запроса."""
+
+    def get_serializer(self, *args, **kwargs):
+        return timed_serializer(super().get_serializer(*args, **kwargs))
+
+
+class SparseFieldsetMixin:
+    """Поля ответа из ?fields= и ?expand= (см. api.fieldsets.Fieldset).
+
+    Набор полей передается сериализатору в контексте, а get_queryset
+    по нему не загружает ненужные колонки, связи и аннотации.
+    """
+    fieldset_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        if self.action not in self.fieldset_actions:
+            return None
+        return Fieldset.from_request(self.request,
+                                     self.get_serializer_class())
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(),
+                'fieldset': self.get_fieldset()}
+
+    def fieldset_columns(self, fieldset=None):
+        """Колонки полей ответа, без набора — всех полей сериализатора."""
+        return model_columns(
+            self.get_serializer_class()(context={'fieldset': fieldset}))
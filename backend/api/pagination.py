@@ -1,7 +1,170 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     """Кастомная пагинация с измененным наименованием параметра."""
     page_size = 6
     page_size_query_param = 'limit'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset на async ORM: COUNT и выборка страницы.
+
+        Номера страниц считает обычный Paginator по диапазону длины
+        выборки, поэтому ссылки и ошибки совпадают с синхронным.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(
+            range(await queryset.acount()), page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        bounds = self.page.object_list
+        self.page.object_list = [
+            instance
+            async for instance in queryset[bounds.start:bounds.stop]]
+        self.request = request
+        return list(self.page)
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (created_at, id) без COUNT(*) и OFFSET.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    поэтому новые записи не сдвигают уже просмотренные страницы.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(name.lstrip('-'))
+                .to_python(value)
+                for name, value in zip(self.ordering, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        values = [
+            instance._meta.get_field(name.lstrip('-'))
+            .value_to_string(instance)
+            for name in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def after(self, values):
+        """Условие «после курсора» в лексикографическом порядке полей."""
+        conditions = []
+        for position, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {self.ordering[index].lstrip('-'): values[index]
+                     for index in range(position)}
+            conditions.append(
+                Q(**equal, **{f'{field}__{lookup}': values[position]}))
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        bound = Q(**{f'{first.lstrip("-")}__{lookup}': values[0]})
+        return bound & reduce(or_, conditions)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.after(self.decode_cursor(queryset, cursor)))
+        return queryset[:self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.cut_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.cut_page([
+            instance
+            async for instance in self.page_queryset(queryset, request)])
+
+    def cut_page(self, page):
+        """Страница без лишнего объекта, по которому видна следующая."""
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = (self.encode_cursor(page[-1])
+                            if self.has_next else None)
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class LimitOrKeysetPagination(LimitPageNumberPagination):
+    """Постраничная пагинация или, при наличии ?cursor=, по ключу.
+
+    Первая страница в режиме курсора запрашивается с пустым ?cursor=,
+    порядок задается атрибутом представления cursor_ordering.
+    """
+    keyset_class = KeysetPagination
+
+    def get_keyset(self, request, view):
+        if self.keyset_class.cursor_query_param not in request.query_params:
+            return None
+        return self.keyset_class(getattr(view, 'cursor_ordering', None))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.get_keyset(request, view)
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.get_keyset(request, view)
+        if self.keyset is not None:
+            return await self.keyset.apaginate_queryset(queryset, request,
+                                                        view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -14,3 +17,14 @@ class OwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         return obj.author == request.user
+
+
+class MetricsPermission(permissions.BasePermission):
+    """Метрики доступны сотрудникам и сборщику с METRICS_TOKEN."""
+
+    def has_permission(self, request, view):
+        if request.user.is_staff:
+            return True
+        header = request.headers.get('Authorization', '')
+        return bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+            header, f'Bearer {settings.METRICS_TOKEN}')
@@ -0,0 +1,33 @@
+import json
+
+from rest_framework import renderers
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    """Рендерер для согласования формата списка покупок.
+
+    Сам файл отдается потоком из представления, рендерер используется
+    только для выбора формата и вывода ошибок.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
@@ -0,0 +1,85 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+
+from foodgram.db_router import reading_from_replica
+from recipes.models import Recipe
+
+from . import constants
+from .versions import get_versions
+
+REPRESENTATION_KEY = 'recipe_representation:{}:{}'
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def representation_key(recipe_id, versions, base_url):
+    """Ключ общего представления: версии рецепта, тегов, ингредиентов.
+
+    Ссылки на изображения абсолютные, поэтому в ключ входит и адрес
+    сайта из запроса.
+    """
+    value = ':'.join(map(str, (*versions, base_url)))
+    return REPRESENTATION_KEY.format(
+        recipe_id, hashlib.md5(value.encode()).hexdigest())
+
+
+def images_ready(recipe):
+    """Пока копии изображений не готовы, в ответе ссылки на оригиналы."""
+    images = ((recipe.image, recipe.image_variants_ready),
+              (recipe.author.avatar, recipe.author.avatar_variants_ready))
+    return all(ready for image, ready in images if image)
+
+
+def overlay(data, recipe=None):
+    """Флаги пользователя из аннотаций запроса страницы.
+
+    Без рецепта флаги сбрасываются: так представление попадает в кеш.
+    Отсутствующие в представлении поля не добавляются.
+    """
+    for flag in USER_FLAGS:
+        if flag in data:
+            data[flag] = getattr(recipe, flag, False)
+    if isinstance(data.get('author'), dict):
+        data['author'] = {**data['author'], 'is_subscribed': getattr(
+            recipe, 'is_author_subscribed', False)}
+    return data
+
+
+def shared_representations(recipes, serialize, base_url):
+    """Не зависящие от пользователя представления рецептов по id.
+
+    Теги и ингредиенты загружаются только для промахов. Реплика может
+    отставать от версий в кеше, поэтому прочитанное с нее представление
+    хранится недолго.
+    """
+    tags, ingredients, *versions = get_versions(
+        'tags', 'ingredients', *(f'recipe:{recipe.pk}' for recipe in recipes))
+    keys = {recipe.pk: representation_key(
+        recipe.pk, (version, tags, ingredients), base_url)
+        for recipe, version in zip(recipes, versions)}
+    cached = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.pk] not in cached]
+    if missing:
+        prefetch_related_objects(missing,
+                                 *Recipe.objects.related_prefetches())
+        fresh = {}
+        for recipe in missing:
+            cached[keys[recipe.pk]] = overlay(serialize(recipe))
+            if images_ready(recipe):
+                fresh[keys[recipe.pk]] = cached[keys[recipe.pk]]
+        cache.set_many(fresh, (
+            constants.RECIPE_REPRESENTATION_REPLICA_TIMEOUT
+            if reading_from_replica()
+            else constants.RECIPE_REPRESENTATION_TIMEOUT))
+    return {pk: cached[key] for pk, key in keys.items()}
+
+
+def recipe_representations(recipes, serialize, request):
+    """Представления рецептов страницы: общее из кеша и флаги пользователя.
+
+    Рецепты должны быть загружены с автором и аннотациями флагов.
+    """
+    shared = shared_representations(recipes, serialize,
+                                    request.build_absolute_uri('/'))
+    return [overlay(shared[recipe.pk], recipe) for recipe in recipes]
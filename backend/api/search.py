@@ -0,0 +1,114 @@
+import bisect
+import threading
+from itertools import islice
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorField)
+from django.db import connections
+from django.db.models import (Case, IntegerField, OuterRef, Q, Subquery, Sum,
+                              Value, When)
+from django.db.models.expressions import RawSQL
+
+from recipes import constants as recipe_constants
+from recipes.models import Ingredient, Recipe, RecipeSearchWord
+from recipes.search import search_words, uses_search_vector
+from recipes.utils import normalize_name
+
+from . import constants
+from .versions import get_versions
+
+
+class IngredientPrefixIndex:
+    """Отсортированный индекс названий ингредиентов в памяти процесса.
+
+    Используется на базах без pg_trgm (SQLite в разработке и тестах).
+    Перестраивается при смене общей версии ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._ids = []
+        self._version = None
+
+    def _entries(self):
+        version, = get_versions('ingredients')
+        with self._lock:
+            if version != self._version:
+                rows = sorted(Ingredient.objects
+                              .values_list('search_name', 'id'))
+                self._keys = [key for key, _ in rows]
+                self._ids = [pk for _, pk in rows]
+                self._version = version
+            return self._keys, self._ids
+
+    def search(self, value, limit):
+        """Id ингредиентов: сначала совпадения по началу, затем вхождения."""
+        keys, ids = self._entries()
+        start = bisect.bisect_left(keys, value)
+        end = bisect.bisect_left(keys, value + '\uffff', lo=start)
+        result = ids[start:min(end, start + limit)]
+        if len(result) < limit:
+            substring = (pk for key, pk in zip(keys, ids)
+                         if value in key and not key.startswith(value))
+            result.extend(islice(substring, limit - len(result)))
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+def search_ingredients(queryset, value,
+                       limit=constants.INGREDIENT_SEARCH_LIMIT):
+    """Поиск ингредиентов для автодополнения с ранжированием."""
+    value = normalize_name(value)
+    if connections[queryset.db].vendor == 'postgresql':
+        return (queryset
+                .filter(search_name__contains=value)
+                .annotate(search_rank=Case(
+                    When(search_name__startswith=value, then=Value(0)),
+                    default=Value(1), output_field=IntegerField()))
+                .order_by('search_rank', 'search_name', 'id')[:limit])
+    ids = ingredient_index.search(value, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *[When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        output_field=IntegerField()))
+
+
+def _word_prefix(word):
+    return Q(word__gte=word, word__lt=word + '\uffff')
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск рецептов по названию и описанию.
+
+    На PostgreSQL используется столбец tsvector с русской конфигурацией
+    и GIN-индексом, на остальных базах — индексированная таблица слов
+    с поиском по началу слова. Результат упорядочен по релевантности.
+    """
+    if uses_search_vector(queryset.db):
+        query = SearchQuery(value, config=recipe_constants.SEARCH_CONFIG,
+                            search_type='websearch')
+        vector = RawSQL(f'"{Recipe._meta.db_table}"."search_vector"', [],
+                        output_field=SearchVectorField())
+        return (queryset.alias(search_vector=vector)
+                .filter(search_vector=query)
+                .annotate(search_rank=SearchRank(vector, query))
+                .order_by('-search_rank', '-created_at', '-id'))
+    words = sorted(search_words(value))
+    if not words:
+        return queryset.none()
+    for word in words:
+        queryset = queryset.filter(pk__in=RecipeSearchWord.objects.filter(
+            _word_prefix(word)).values('recipe_id'))
+    matched = Q()
+    for word in words:
+        matched |= _word_prefix(word)
+    rank = (RecipeSearchWord.objects.filter(matched, recipe=OuterRef('pk'))
+            .order_by().values('recipe').annotate(total=Sum('weight'))
+            .values('total'))
+    return (queryset.annotate(search_rank=Subquery(rank))
+            .order_by('-search_rank', '-created_at', '-id'))
@@ -1,25 +1,86 @@
 import base64
+import binascii
+from functools import partial
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers, validators
 
+from . import constants
+from .fieldsets import SparseFieldsMixin
+from .representations import overlay, recipe_representations
+from recipes.constants import AVATAR_IMAGE_VARIANTS, RECIPE_IMAGE_VARIANTS
+from recipes.images import variant_urls
 from recipes.models import (Ingredient, Recipe, RecipeIngredient, User,
                             RecipeTag, PurchaseUser, Favorite, Tag)
+from recipes.shopping_list import change_recipe_ingredients
+from recipes.utils import tags_mask
 from users.models import Follow
 
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение в data URI.
+
+    Декодирование base64 и verify() Pillow остаются в запросе: размер
+    ограничен IMAGE_MAX_UPLOAD_SIZE, verify() читает только заголовки
+    без распаковки пикселей, а неверный файл должен вернуть 400.
+    Распаковка и уменьшение идут в пуле (recipes.images).
+    """
+    default_error_messages = {
+        'invalid_base64': 'Изображение закодировано неверно.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
+            if len(imgstr) * 3 // 4 > settings.IMAGE_MAX_UPLOAD_SIZE:
+                self.fail('too_large',
+                          max_size=settings.IMAGE_MAX_UPLOAD_SIZE)
+            try:
+                content = base64.b64decode(imgstr)
+            except binascii.Error:
+                self.fail('invalid_base64')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = ContentFile(content, name='temp.' + ext)
 
         return super().to_internal_value(data)
 
 
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения в форматах WebP и JPEG.
+
+    Готовность копий берется из поля модели {source}_variants_ready.
+    """
+
+    def __init__(self, variants, **kwargs):
+        self.variants = variants
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    @property
+    def columns(self):
+        return (self.source, f'{self.source}_variants_ready')
+
+    def get_attribute(self, instance):
+        return (super().get_attribute(instance),
+                getattr(instance, f'{self.source}_variants_ready'))
+
+    def to_representation(self, value):
+        value, ready = value
+        if not value:
+            return None
+        urls = variant_urls(value.name, self.variants, ready, value.storage)
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {variant: {extension: request.build_absolute_uri(url)
+                          for extension, url in formats.items()}
+                for variant, formats in urls.items()}
+
+
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True, allow_null=True)
 
@@ -28,14 +89,16 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar',)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.BooleanField(read_only=True,
                                              default=False)
+    avatar_variants = ImageVariantsField(AVATAR_IMAGE_VARIANTS,
+                                         source='avatar')
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar')
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_variants')
         read_only = ('id', 'avatar')
 
 
@@ -48,27 +111,34 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 
 class RecipeFollowSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(RECIPE_IMAGE_VARIANTS, source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
-class UserFollowSerializer(serializers.ModelSerializer):
+class UserFollowSerializer(SparseFieldsMixin,
+                           serializers.ModelSerializer):
     is_subscribed = serializers.BooleanField(read_only=True)
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.IntegerField(read_only=True)
+    avatar_variants = ImageVariantsField(AVATAR_IMAGE_VARIANTS,
+                                         source='avatar')
 
     def get_recipes(self, obj):
-        rec_limit = self.context['request'].query_params.get('recipes_limit')
-        limit = None if rec_limit is None else int(rec_limit)
-        return RecipeFollowSerializer(
-            obj.recipes.all()[:limit], many=True).data
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            limit = self.context.get('recipes_limit',
+                                     constants.MAX_RECIPES_LIMIT)
+            recipes = obj.recipes.all()[:limit]
+        return RecipeFollowSerializer(recipes, many=True).data
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed', 'recipes', 'recipes_count', 'avatar')
+                  'is_subscribed', 'recipes', 'recipes_count', 'avatar',
+                  'avatar_variants')
         read_only = ('id', 'avatar')
 
 
@@ -115,9 +185,45 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only = ('id',)
 
 
+def _primary_keys(values):
+    keys = set()
+    for value in values:
+        try:
+            if not isinstance(value, bool):
+                keys.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return keys
+
+
+class RelatedObjectsListSerializer(serializers.ListSerializer):
+    """Список, связанные объекты которого загружаются одним запросом IN."""
+
+    def to_internal_value(self, data):
+        self.related_objects = {}
+        if isinstance(data, list):
+            self.related_objects = self.child.load_related(data)
+        return super().to_internal_value(data)
+
+
+class LoadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичный ключ объекта, загруженного списком-родителем."""
+
+    def to_internal_value(self, data):
+        objects = self.parent.parent.related_objects
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return objects[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
-                                            source='ingredient', required=True)
+    id = LoadedPrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
+                                      source='ingredient', required=True)
     name = serializers.SlugRelatedField(source='ingredient', slug_field='name',
                                         read_only=True)
     measurement_unit = (serializers
@@ -125,11 +231,26 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
                                           slug_field='measurement_unit',
                                           read_only=True))
 
+    @staticmethod
+    def load_related(data):
+        return Ingredient.objects.in_bulk(_primary_keys(
+            item.get('id') for item in data if isinstance(item, dict)))
+
     class Meta:
         model = RecipeIngredient
+        list_serializer_class = RelatedObjectsListSerializer
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    """Ингредиент рецепта без загрузки самого ингредиента."""
+    id = serializers.IntegerField(source='ingredient_id', read_only=True)
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
 class RecipeTagSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
@@ -137,21 +258,36 @@ class RecipeTagSerializer(serializers.ModelSerializer):
         return super().to_representation(instance)
 
     def to_internal_value(self, data):
-        try:
-            data = Tag.objects.get(id=data)
-        except Tag.DoesNotExist:
+        keys = _primary_keys([data])
+        tag = self.parent.related_objects.get(keys.pop() if keys else None)
+        if tag is None:
             raise serializers.ValidationError(
                 {'tag': f'Тег с id: {data} отсутствует.'})
-        return data
+        return tag
+
+    @staticmethod
+    def load_related(data):
+        return Tag.objects.in_bulk(_primary_keys(data))
 
     class Meta:
         model = Tag
+        list_serializer_class = RelatedObjectsListSerializer
         fields = ('id', 'name', 'slug')
         lookup_field = 'slug'
         read_only = ('id', 'name', 'slug')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class CachedRecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов из общего кеша представлений, если он включен."""
+
+    def to_representation(self, data):
+        if not self.child.use_cache:
+            return super().to_representation(data)
+        return recipe_representations(list(data), self.child.shared_data,
+                                      self.context['request'])
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     is_favorited = serializers.BooleanField(read_only=True, default=False)
     tags = RecipeTagSerializer(many=True, source='recipe_tag', required=True)
     ingredients = RecipeIngredientSerializer(many=True,
@@ -160,8 +296,38 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True, default=False)
     image = Base64ImageField(required=True, allow_null=False)
+    image_variants = ImageVariantsField(RECIPE_IMAGE_VARIANTS, source='image')
     author = UserSerializer(
         read_only=True, default=serializers.CurrentUserDefault())
+    collapsed_fields = {
+        'author': partial(serializers.PrimaryKeyRelatedField,
+                          read_only=True),
+        'tags': partial(serializers.SlugRelatedField, slug_field='tag_id',
+                        source='recipe_tag', many=True, read_only=True),
+        'ingredients': partial(IngredientAmountSerializer, many=True,
+                               source='recipe_ingredient', read_only=True),
+    }
+
+    @property
+    def use_cache(self):
+        """Представление берется из кеша в list и retrieve (см. контекст).
+
+        Рецепты тогда загружаются без связанных объектов, но с флагами
+        пользователя в аннотациях.
+        """
+        return self.context.get('representation_cache', False)
+
+    def shared_data(self, instance):
+        return super().to_representation(instance)
+
+    def to_representation(self, instance):
+        if self.use_cache:
+            return recipe_representations([instance], self.shared_data,
+                                          self.context['request'])[0]
+        if self.fieldset is not None:
+            # подписка на автора загружена аннотацией рецепта
+            return overlay(super().to_representation(instance), instance)
+        return super().to_representation(instance)
 
     def _validate_non_empty_field(self, attrs, field, error_field):
         if field not in attrs or len(attrs.get(field)) == 0:
@@ -169,10 +335,10 @@ class RecipeSerializer(serializers.ModelSerializer):
                 {error_field: 'Обязательное поле.'})
 
     def validate(self, attrs):
-        self._validate_non_empty_field(attrs,
-                                       'recipe_tag', 'tags')
-        self._validate_non_empty_field(attrs,
-                                       'recipe_ingredient', 'ingredients')
+        for field, error_field in (('recipe_tag', 'tags'),
+                                   ('recipe_ingredient', 'ingredients')):
+            if not self.partial or field in attrs:
+                self._validate_non_empty_field(attrs, field, error_field)
         return super().validate(attrs)
 
     def _validate_unique_items(self, attrs, field, error_field):
@@ -195,42 +361,98 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def _related_data_save(instance, tags, ingredients):
+        """Создание связей с сохранением их в кеше предзагрузки рецепта.
+
+        Ответ на создание сериализуется из этих объектов без запросов.
+        """
+        instance._prefetched_objects_cache = {
+            'recipe_tag': RecipeTag.objects.bulk_create(
+                [RecipeTag(recipe=instance, tag=tag) for tag in tags]),
+            'recipe_ingredient': RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=instance,
+                    ingredient=ingredient['ingredient'],
+                    amount=ingredient['amount'])
+                for ingredient in ingredients
+            ]),
+        }
+
+    @staticmethod
+    def _update_tags(instance, tags):
+        """Удаление и добавление только изменившихся тегов."""
+        current = {item.tag_id for item in instance.recipe_tag.all()}
+        wanted = {tag.id for tag in tags}
         RecipeTag.objects.bulk_create(
-            [RecipeTag(recipe=instance, tag=tag) for tag in tags])
+            [RecipeTag(recipe=instance, tag_id=tag_id)
+             for tag_id in wanted - current])
+        if current - wanted:
+            RecipeTag.objects.filter(
+                recipe=instance, tag_id__in=current - wanted).delete()
+
+    @staticmethod
+    def _update_ingredients(instance, ingredients):
+        """Не более одного DELETE, INSERT и UPDATE на все ингредиенты.
+
+        Разница количеств переносится в списки покупок покупателей.
+        """
+        current = {item.ingredient_id: item
+                   for item in instance.recipe_ingredient.all()}
+        wanted = {item['ingredient'].id: item['amount']
+                  for item in ingredients}
+        removed = current.keys() - wanted.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                id__in=[current[key].id for key in removed]).delete()
         RecipeIngredient.objects.bulk_create([
-            RecipeIngredient(
-                recipe=instance,
-                ingredient=ingredient['ingredient'],
-                amount=ingredient['amount'])
-            for ingredient in ingredients
-        ])
+            RecipeIngredient(recipe=instance, ingredient_id=key,
+                             amount=amount)
+            for key, amount in wanted.items() if key not in current])
+        changed = []
+        deltas = {key: -current[key].amount for key in removed}
+        for key, amount in wanted.items():
+            item = current.get(key)
+            deltas[key] = amount - (item.amount if item else 0)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        change_recipe_ingredients(instance.pk, deltas)
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('recipe_tag')
-        ingredients = validated_data.pop('recipe_ingredient')
+        tags = validated_data.pop('recipe_tag', None)
+        ingredients = validated_data.pop('recipe_ingredient', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
-        instance.recipe_ingredient.all().delete()
-        instance.recipe_tag.all().delete()
-        self._related_data_save(instance, tags, ingredients)
+        if tags is not None:
+            instance.tags_mask = tags_mask(tag.bit for tag in tags)
+        # счетчики и флаги, загруженные в get_object(), могли измениться
+        # с тех пор, поэтому пишутся только поля запроса; tags_mask
+        # нужен и без тегов, чтобы post_save сбросил кеши рецепта
+        instance.save(update_fields=[*validated_data, 'tags_mask'])
+        if tags is not None:
+            self._update_tags(instance, tags)
+        if ingredients is not None:
+            self._update_ingredients(instance, ingredients)
         return instance
 
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('recipe_tag')
         ingredients = validated_data.pop('recipe_ingredient')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data,
+            tags_mask=tags_mask(tag.bit for tag in tags))
         self._related_data_save(recipe, tags, ingredients)
         return recipe
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
         read_only = ('id', 'author')
+        list_serializer_class = CachedRecipeListSerializer
 
         validators = [
             validators.UniqueTogetherValidator(
@@ -295,3 +517,13 @@ class FavoriteSerializer(BaseActionSerializer):
                 message='Рецепт уже добавлен в избранное.'
             )
         ]
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Id рецептов для массовых действий, повторы отбрасываются."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=constants.BULK_RECIPES_LIMIT)
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, Ingredient, PurchaseUser, Recipe,
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.signals import in_bulk, variants_rendered
+from users.models import Follow, User
+
+from .authentication import token_cache
+from .metrics import record_query
+from .utils import bump_shopping_cart_version
+from .versions import bump_versions
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver((post_save, post_delete), sender=PurchaseUser)
+def invalidate_shopping_cart(sender, instance, **kwargs):
+    if in_bulk(sender):
+        return
+    transaction.on_commit(
+        lambda: bump_shopping_cart_version(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_buyers_shopping_carts(sender, instance, created, **kwargs):
+    if created:
+        return
+    transaction.on_commit(lambda: bump_shopping_cart_version(
+        *instance.purchases.values_list('user_id', flat=True)))
+
+
+def bump_on_commit(*names):
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_on_commit('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_on_commit('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def bump_recipe_relations_version(sender, instance, **kwargs):
+    bump_on_commit(f'recipe:{instance.recipe_id}')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=PurchaseUser)
+@receiver((post_save, post_delete), sender=Follow)
+def bump_user_version(sender, instance, **kwargs):
+    if in_bulk(sender):
+        return
+    bump_on_commit(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(lambda: bump_versions(*(
+        f'recipe:{pk}'
+        for pk in instance.recipes.values_list('pk', flat=True))))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    transaction.on_commit(lambda: token_cache.delete(instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    """Пароль, is_active и прочие поля пользователя в кеше токенов."""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(lambda: token_cache.delete(
+        *Token.objects.filter(user=instance).values_list('key', flat=True)))
+
+
+@receiver(variants_rendered, sender=Recipe)
+def bump_rendered_recipes_version(sender, pks, **kwargs):
+    bump_versions(*(f'recipe:{pk}' for pk in pks))
+
+
+@receiver(variants_rendered, sender=User)
+def invalidate_rendered_avatars(sender, pks, **kwargs):
+    """Аватар выводится в рецептах автора и в кеше токенов."""
+    bump_versions(*(f'recipe:{pk}' for pk in Recipe.objects.filter(
+        author__in=pks).values_list('pk', flat=True)))
+    token_cache.delete(*Token.objects.filter(
+        user__in=pks).values_list('key', flat=True))
@@ -1,12 +1,12 @@
 from django.urls import include, path
-from rest_framework import routers
 
+from .async_views import AsyncReadRouter
 from .views import (IngredientViewSet, RecipeViewSet,
                     TagViewSet, CustomUserViewSet)
 
 app_name = 'api'
 
-router = routers.DefaultRouter()
+router = AsyncReadRouter()
 router.register('users', CustomUserViewSet)
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
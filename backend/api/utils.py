@@ -1,29 +1,142 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import csv
+import io
+from uuid import uuid4
 
-from recipes.models import Ingredient
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import StreamingHttpResponse
 
+from . import constants
+from recipes.models import ShoppingListItem
 
-def create_shopping_cart(user):
-    """Формирование списка покупок пользователя."""
-    ingredients = (Ingredient.objects
-                   .filter(ingredient_recipe__recipe__purchases__user=user)
-                   .annotate(total_amount=Sum('ingredient_recipe__amount')))
+SHOPPING_CART_VERSION_KEY = 'shopping_cart_version:{}'
+SHOPPING_CART_KEY = 'shopping_cart:{}:{}:{}'
 
-    response = HttpResponse(content_type='text/plain')
-    response['Content-Disposition'] = (
-        'attachment; filename="shopping_cart.txt"')
 
-    lines = []
-    lines.append("Список покупок:\n")
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_version(user_id):
+    """Текущая версия списка покупок пользователя."""
+    key = SHOPPING_CART_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_shopping_cart_version(*user_ids):
+    """Сброс версии списков покупок после изменения корзины."""
+    cache.delete_many(
+        [SHOPPING_CART_VERSION_KEY.format(user_id) for user_id in user_ids])
+
+
+def shopping_cart_ingredients(user):
+    """Строки списка покупок из таблицы, которая хранит готовые суммы."""
+    return (ShoppingListItem.objects.filter(user=user)
+            .values('total_amount', name=F('ingredient__name'),
+                    measurement_unit=F('ingredient__measurement_unit'))
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+            .iterator())
+
+
+def render_txt(ingredients):
+    yield 'Список покупок:\n'
+    for ingredient in ingredients:
+        yield (f'{ingredient["name"]}: {ingredient["total_amount"]}'
+               f'{ingredient["measurement_unit"]}'
+               ' | Куплено: [ ]\n')
+
 
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
     for ingredient in ingredients:
-        line = (
-            f'{ingredient.name}: {ingredient.total_amount}'
-            f'{ingredient.measurement_unit}'
-            ' | Куплено: [ ]\n')
-        lines.append(line)
+        yield writer.writerow((ingredient['name'],
+                               ingredient['total_amount'],
+                               ingredient['measurement_unit']))
 
-    response.writelines(lines)
 
+def render_pdf(ingredients):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    font = 'ShoppingCartFont'
+    if font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(font, settings.SHOPPING_CART_PDF_FONT))
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    top, margin, step = height - 60, 50, 18
+    lines = (line.rstrip('\n') for line in render_txt(ingredients))
+    position = top
+    for line in lines:
+        if position < margin:
+            document.showPage()
+            position = top
+        document.setFont(font, 12)
+        document.drawString(margin, position, line)
+        position -= step
+    document.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
+
+
+def _stream_and_cache(key, chunks):
+    """Отдача файла частями с сохранением результата в кеш."""
+    rendered = []
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= constants.SHOPPING_CART_CHUNK_SIZE:
+            rendered.append(b''.join(buffer))
+            yield rendered[-1]
+            buffer, size = [], 0
+    if buffer:
+        rendered.append(b''.join(buffer))
+        yield rendered[-1]
+    cache.set(key, b''.join(rendered), constants.SHOPPING_CART_CACHE_TIMEOUT)
+
+
+def _iter_cached(content):
+    step = constants.SHOPPING_CART_CHUNK_SIZE
+    for start in range(0, len(content), step):
+        yield content[start:start + step]
+
+
+def create_shopping_cart(user, file_format='txt'):
+    """Формирование списка покупок пользователя."""
+    content_type, render = SHOPPING_CART_FORMATS[file_format]
+    key = SHOPPING_CART_KEY.format(user.id, shopping_cart_version(user.id),
+                                   file_format)
+    content = cache.get(key)
+    if content is None:
+        chunks = _stream_and_cache(
+            key, render(shopping_cart_ingredients(user)))
+    else:
+        chunks = _iter_cached(content)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{file_format}"')
     return response
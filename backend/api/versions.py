@@ -0,0 +1,43 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+
+
+def get_versions(*names):
+    """Версии данных (время последнего изменения в наносекундах)."""
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+async def aget_versions(*names):
+    """Асинхронный вариант get_versions для представлений под ASGI."""
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, now, None)
+        versions.update(await cache.aget_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_versions(*names):
+    """Новая версия данных после их изменения."""
+    now = time.time_ns()
+    cache.set_many({VERSION_KEY.format(name): now for name in names}, None)
+
+
+def make_etag(versions, *extra):
+    value = ':'.join(map(str, (*versions, *extra)))
+    return '"{}"'.format(hashlib.md5(value.encode()).hexdigest())
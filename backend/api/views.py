@@ -1,32 +1,44 @@
-from django.db.models import BooleanField, Prefetch, Value, Count
-from django.shortcuts import get_object_or_404, redirect
+from django.db.models import BooleanField, Value
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import permissions, viewsets, views, status
+from rest_framework import (permissions, serializers, status, views,
+                            viewsets)
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
-from . import constants
+from . import bulk, constants
 from .filters import RecipeFilter, IngredientFilter
-from .permissions import OwnerOrReadOnly
+from .metrics import registry, timed_serializer
+from .mixins import (AsyncReadMixin, ConditionalGetMixin,
+                     SparseFieldsetMixin, TimedSerializerMixin)
+from .pagination import LimitOrKeysetPagination
+from .permissions import MetricsPermission, OwnerOrReadOnly
+from .renderers import (CSVShoppingCartRenderer, PDFShoppingCartRenderer,
+                        TextShoppingCartRenderer)
 from .serializers import (
     TagSerializer, IngredientSerializer, RecipeSerializer,
     ShoppingCartSerializer, FavoriteSerializer, AvatarSerializer,
-    FollowSerializer, UserFollowSerializer)
-from .utils import create_shopping_cart
+    FollowSerializer, RecipeIdsSerializer, UserFollowSerializer)
+from .utils import SHOPPING_CART_FORMATS, create_shopping_cart
 from recipes.models import Ingredient, Recipe, User, Tag
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, TimedSerializerMixin,
+                 AsyncReadMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
     http_method_names = ['get']
+    version_names = ('tags',)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, TimedSerializerMixin,
+                        AsyncReadMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
@@ -34,31 +46,88 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     http_method_names = ['get']
+    version_names = ('ingredients',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, SparseFieldsetMixin,
+                    TimedSerializerMixin, AsyncReadMixin,
+                    viewsets.ModelViewSet):
     model = Recipe
     queryset = Recipe.tags_and_ingredients
     serializer_class = RecipeSerializer
     permission_classes = (permissions.AllowAny,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = LimitOrKeysetPagination
+    cursor_ordering = ('-created_at', '-id')
+    conditional_actions = ('retrieve',)
+    cached_actions = ('list', 'retrieve')
+    serialize_in_thread = True
+    etag_per_user = True
+
+    def get_version_names(self):
+        names = [f'recipe:{self.kwargs["pk"]}', 'tags', 'ingredients']
+        if self.request.user.is_authenticated:
+            names.append(f'user:{self.request.user.pk}')
+        return names
 
     def get_queryset(self):
-        queryset = self.queryset
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            return self.sparse_queryset(fieldset)
+        cached = self.action in self.cached_actions
+        # из кеша берутся теги, ингредиенты и автор, флаги — из аннотаций
+        queryset = (Recipe.objects.select_related('author') if cached
+                    else self.queryset.all())
         user = self.request.user
         if user.is_anonymous:
             return queryset.annotate(
                 is_favorited=Value(False, output_field=BooleanField()),
                 is_in_shopping_cart=Value(False, output_field=BooleanField())
             )
-        return (queryset.all().is_favorite_and_shop_cart(user)
-                .prefetch_related(Prefetch(
-                    'author', queryset=User.objects.is_subscribe(
-                        self.request.user))))
+        queryset = queryset.is_favorite_and_shop_cart(user)
+        if cached:
+            return queryset.with_author_subscribed_flag(user)
+        return queryset.with_author_subscription(user)
+
+    def sparse_queryset(self, fieldset):
+        """Рецепты только с колонками, связями и флагами полей fieldset.
+
+        Анонимному пользователю флаги не нужны: поля по умолчанию False.
+        """
+        queryset = Recipe.objects.only(
+            *self.fieldset_columns(fieldset),
+            *(name.lstrip('-') for name in self.cursor_ordering))
+        if fieldset.expands('author'):
+            queryset = queryset.select_related('author')
+        if fieldset.includes('tags'):
+            queryset = queryset.prefetch_related(
+                queryset.tags_prefetch(fieldset.expands('tags')))
+        if fieldset.includes('ingredients'):
+            queryset = queryset.prefetch_related(
+                queryset.ingredients_prefetch(
+                    fieldset.expands('ingredients')))
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        queryset = queryset.is_favorite_and_shop_cart(
+            user, favorite=fieldset.includes('is_favorited'),
+            shopping_cart=fieldset.includes('is_in_shopping_cart'))
+        if fieldset.expands('author'):
+            return queryset.with_author_subscribed_flag(user)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # в общем кеше только полные представления
+        return {**context, 'representation_cache': (
+            self.action in self.cached_actions
+            and context['fieldset'] is None)}
 
     def get_permissions(self):
-        if self.action in ['shopping_cart', 'favorite']:
+        if self.action in ['shopping_cart', 'favorite',
+                           'download_shopping_cart', 'bulk_shopping_cart',
+                           'bulk_favorite', 'favorites_to_shopping_cart']:
             return (permissions.IsAuthenticated(),)
         if self.action not in constants.SAFE_ACTION_FOR_RECIPE:
             return (OwnerOrReadOnly(),)
@@ -80,8 +149,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         data = {instance_name: self.kwargs['pk']}
 
         if request.method == 'POST':
-            serializer = serializer_class(data=data,
-                                          context={'request': request})
+            serializer = timed_serializer(serializer_class(
+                data=data, context={'request': request}))
             if serializer.is_valid():
                 serializer.save(user=user)
                 return Response(serializer.data,
@@ -109,30 +178,84 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'recipe', request, *args, **kwargs
         )
 
-    @action(methods=['get'], detail=False)
-    def download_shopping_cart(self, request, *args, **kwargs):
-        return create_shopping_cart(self.request.user)
+    @staticmethod
+    def bulk_recipe_ids(data):
+        serializer = RecipeIdsSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
 
+    def bulk_action(self, relation, request):
+        """Массовое действие: POST добавляет рецепты из тела запроса.
 
-class ShortLinkRedirectView(views.APIView):
-    lookup_field = 'short_url'
-    permission_classes = (permissions.AllowAny,)
+        DELETE удаляет рецепты из параметра recipes=1,2,3, без него — все.
+        """
+        if request.method == 'POST':
+            results = relation.add(request.user,
+                                   self.bulk_recipe_ids(request.data))
+        else:
+            recipes = request.query_params.get('recipes')
+            results = relation.remove(request.user, recipes and (
+                self.bulk_recipe_ids({'recipes': recipes.split(',')})))
+        return Response({'recipes': results})
 
-    def get(self, request, slug):
-        recipe = get_object_or_404(Recipe, short_url=slug)
-        return redirect(f'/recipes/{recipe.id}/')
+    @action(methods=['post', 'delete'], detail=False,
+            url_path='shopping_cart')
+    def bulk_shopping_cart(self, request, *args, **kwargs):
+        return self.bulk_action(bulk.shopping_cart, request)
 
+    @action(methods=['post', 'delete'], detail=False, url_path='favorite')
+    def bulk_favorite(self, request, *args, **kwargs):
+        return self.bulk_action(bulk.favorites, request)
 
-class CustomUserViewSet(UserViewSet):
-    queryset = User.objects.with_related_data()
+    @action(methods=['post'], detail=False,
+            url_path='shopping_cart/from_favorites')
+    def favorites_to_shopping_cart(self, request, *args, **kwargs):
+        recipe_ids = sorted(bulk.favorites.recipe_ids(request.user))
+        return Response({'recipes': bulk.shopping_cart.add(request.user,
+                                                           recipe_ids)})
+
+    @action(methods=['get'], detail=False,
+            renderer_classes=(TextShoppingCartRenderer,
+                              CSVShoppingCartRenderer,
+                              PDFShoppingCartRenderer, JSONRenderer))
+    def download_shopping_cart(self, request, *args, **kwargs):
+        file_format = request.accepted_renderer.format
+        if file_format not in SHOPPING_CART_FORMATS:
+            file_format = 'txt'
+        return create_shopping_cart(self.request.user, file_format)
+
+
+class CustomUserViewSet(SparseFieldsetMixin, TimedSerializerMixin,
+                        UserViewSet):
+    queryset = User.objects.all()
+    pagination_class = LimitOrKeysetPagination
+    cursor_ordering = ('-date_joined', '-id')
+    fieldset_actions = ('list', 'retrieve', 'me', 'subscriptions')
 
     def get_queryset(self):
+        """Только колонки полей ответа; рецепты загружает subscriptions.
+
+        Изменения пользователя (djoser) получают его полностью.
+        """
         queryset = self.queryset
+        fieldset = self.get_fieldset()
+        if self.action in self.fieldset_actions:
+            queryset = queryset.only(
+                *self.fieldset_columns(fieldset),
+                *(name.lstrip('-') for name in self.cursor_ordering))
+        # по аннотации подписки выбираются подписки пользователя
+        if (fieldset is not None and not fieldset.includes('is_subscribed')
+                and self.action != 'subscriptions'):
+            return queryset
         if self.request.user.is_anonymous:
             return queryset.annotate(
                 is_subscribed=Value(False, output_field=BooleanField()))
-        return queryset.is_subscribe(self.request.user).annotate(
-            recipes_count=Count('recipes'))
+        return queryset.is_subscribe(self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'subscriptions':
+            return UserFollowSerializer
+        return super().get_serializer_class()
 
     def get_permissions(self):
         if self.action in constants.ACTION_FOR_USER:
@@ -143,7 +266,8 @@ class CustomUserViewSet(UserViewSet):
     def update_avatar(self, request, *args, **kwargs):
         user = request.user
         if request.method == 'PUT':
-            serializer = AvatarSerializer(user, data=request.data)
+            serializer = timed_serializer(
+                AvatarSerializer(user, data=request.data))
             if serializer.is_valid():
                 serializer.save()
                 return Response(serializer.data, status=status.HTTP_200_OK)
@@ -154,29 +278,52 @@ class CustomUserViewSet(UserViewSet):
             user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_recipes_limit(self):
+        value = self.request.query_params.get(
+            'recipes_limit', constants.MAX_RECIPES_LIMIT)
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            limit = -1
+        if limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Ожидается неотрицательное целое число.'})
+        return min(limit, constants.MAX_RECIPES_LIMIT)
+
     @action(methods=['get'], detail=False)
     def subscriptions(self, request, *args, **kwargs):
+        limit = self.get_recipes_limit()
+        fieldset = self.get_fieldset()
         queryset = self.get_queryset().filter(is_subscribed=True)
+        if fieldset is None or fieldset.includes('recipes'):
+            queryset = queryset.with_recipes_preview(limit)
+        context = {'request': request, 'recipes_limit': limit,
+                   'fieldset': fieldset}
         page = self.paginate_queryset(queryset)
 
         if page is not None:
-            serializer = UserFollowSerializer(page, many=True,
-                                              context={'request': request})
+            serializer = timed_serializer(UserFollowSerializer(
+                page, many=True, context=context))
             return self.get_paginated_response(serializer.data)
 
-        serializer = UserFollowSerializer(queryset, many=True)
+        serializer = timed_serializer(UserFollowSerializer(
+            queryset, many=True, context=context))
         return Response(serializer.data)
 
     @action(methods=['post'], detail=True, url_path='subscribe')
     def create_subscribe(self, request, *args, **kwargs):
         following = self.get_object()
+        limit = self.get_recipes_limit()
         data = {'following': following.id}
         serializer = FollowSerializer(data=data,
                                       context={'request': request})
         if serializer.is_valid():
             serializer.save(user=self.request.user, following=following)
-            user_data = UserFollowSerializer(self.get_object(),
-                                             context={'request': request}).data
+            following = (self.get_queryset().with_recipes_preview(limit)
+                         .get(pk=following.pk))
+            user_data = timed_serializer(UserFollowSerializer(
+                following,
+                context={'request': request, 'recipes_limit': limit})).data
             return Response(user_data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -187,3 +334,12 @@ class CustomUserViewSet(UserViewSet):
                                    user=user)
         self.perform_destroy(follow)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsView(views.APIView):
+    """Гистограммы задержек всех воркеров в формате Prometheus."""
+    permission_classes = (MetricsPermission,)
+
+    def get(self, request):
+        return HttpResponse(registry.render(),
+                            content_type='text/plain; version=0.0.4')
@@ -0,0 +1,53 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# база для чтения в текущем запросе, ставится DatabaseRoutingMiddleware
+read_database = ContextVar('read_database', default=None)
+
+
+def replicas():
+    """Псевдонимы баз-реплик: все, кроме основной."""
+    return [alias for alias in settings.DATABASES
+            if alias != DEFAULT_DB_ALIAS]
+
+
+def choose_replica():
+    """Реплика для запроса; без реплик чтение идет с основной базы."""
+    aliases = replicas()
+    return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+
+def reading_from_replica():
+    return read_database.get() not in (None, DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_database(alias):
+    """Чтение из базы alias внутри блока, в том числе в sync_to_async."""
+    token = read_database.set(alias)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Запись в основную базу, чтение из базы, выбранной для запроса.
+
+    Вне HTTP-запросов (команды, shell, миграции) база не выбрана,
+    и чтение тоже идет с основной.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база
+        return True
@@ -31,6 +31,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.ConcurrencyLimitMiddleware',
+    'api.middleware.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +77,48 @@ DATABASES = {
     }
 }
 
+# Local run on SQLite files: SQLITE_PATH is the primary database
+
+if os.getenv('SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH'),
+        }
+    }
+
+# Read replicas: comma separated Postgres hosts, or SQLite files when
+# SQLITE_PATH is set. Safe API requests read from a random replica, writes
+# go to the primary, and a client reads from the primary for
+# REPLICA_PIN_SECONDS after its own write
+
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'NAME' if os.getenv('SQLITE_PATH') else 'HOST': replica.strip(),
+    }
+
+DATABASE_ROUTERS = ['foodgram.db_router.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Cache shared by all workers: versions for ETags, shopping cart files
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+        }
+    }
+
 
 # Authetication and djoser settings
 
@@ -100,7 +145,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -121,6 +166,23 @@ DJOSER = {
     }
 }
 
+# ASGI: async list/retrieve of tags, ingredients and recipes and the limit
+# of requests processed at once by one worker
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'True') == 'True'
+ASGI_MAX_REQUESTS = int(os.getenv('ASGI_MAX_REQUESTS', 20))
+
+# Request metrics (Server-Timing for staff and /metrics for Prometheus)
+
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/foodgram_metrics')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Shopping cart export
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 # Internationalization
 
 LANGUAGE_CODE = 'ru-RU'
@@ -144,6 +206,12 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
 
+# Image variants (resized copies are rendered in a process pool)
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_QUEUE_SIZE = int(os.getenv('IMAGE_QUEUE_SIZE', 32))
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
-from api.views import ShortLinkRedirectView
+from api.async_views import short_link_redirect
+from api.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('s/<str:slug>/', ShortLinkRedirectView.as_view(),
-         name='redirect-link')
+    path('s/<str:slug>/', short_link_redirect, name='redirect-link'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
-from django.db.models import Count
 from django.forms.models import BaseInlineFormSet
 
 from .models import (Recipe, Ingredient, RecipeIngredient,
                      RecipeTag, Favorite, PurchaseUser, Tag)
+from .shopping_list import buyers, rebuild
 
 
 class FavoriteStackedInline(admin.StackedInline):
@@ -59,19 +59,41 @@ class RecipeAdmin(admin.ModelAdmin):
                FavoriteStackedInline, PurchaseStackedInline]
     readonly_fields = ['count_favorite']
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(_favorite_count=Count('favorites'))
-        return queryset
-
     def count_favorite(self, obj):
-        return obj._favorite_count
+        return obj.favorites_count
     count_favorite.short_description = 'В избранном'
 
+    def save_related(self, request, form, formsets, change):
+        """Пересчет списков покупок, если менялись ингредиенты рецепта."""
+        users = buyers(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        if any(formset.model is RecipeIngredient and formset.has_changed()
+               for formset in formsets):
+            rebuild(users | buyers(form.instance.pk))
+
+
+class RecipeIngredientAdmin(admin.ModelAdmin):
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        users = buyers(obj.recipe_id)
+        if change and 'recipe' in form.changed_data:
+            users |= buyers(form.initial['recipe'])
+        rebuild(users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild(buyers(obj.recipe_id))
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild(set().union(*map(buyers, recipe_ids)))
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(RecipeIngredient)
+admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(PurchaseUser)
 admin.site.register(Favorite)
 admin.site.register(RecipeTag)
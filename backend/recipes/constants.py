@@ -3,7 +3,27 @@ MAX_LENGTH_NAME_INGREDIENT = 128
 MAX_LENGTH_NAME_RECIPE = 256
 MAX_LENGTH_SHORT_URL = 6
 MAX_LENGTH_TAG = 32
+MAX_LENGTH_SEARCH_WORD = 64
 MIN_VALUE = 1
+TAGS_MASK_BITS = 63
+SHOPPING_LIST_BATCH_SIZE = 1000
+
+SEARCH_CONFIG = 'russian'
+SEARCH_WEIGHT_NAME = 2
+SEARCH_WEIGHT_TEXT = 1
 
 SYMBOLS_FOR_SHORT_URL = (
     'ABCDEFGHJKLMNOPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz234567890')
+SHORT_URL_MULTIPLIER = 2654435761
+SHORT_URL_OFFSET = 7919000023
+SHORT_URL_ATTEMPTS = 8
+
+IMAGE_VARIANTS = {
+    'card': (600, 600),
+    'detail': (1200, 1200),
+    'avatar': (256, 256),
+}
+RECIPE_IMAGE_VARIANTS = ('card', 'detail')
+AVATAR_IMAGE_VARIANTS = ('avatar',)
+IMAGE_VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+IMAGE_VARIANT_QUALITY = 82
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(settings.IMAGE_QUEUE_SIZE)
+
+
+def variant_name(name, variant, extension):
+    """Путь уменьшенной копии в каталоге variants рядом с оригиналом."""
+    path = PurePosixPath(name)
+    return str(path.parent / 'variants' / f'{path.stem}_{variant}.{extension}')
+
+
+def variant_names(name, variants):
+    """Пути всех копий; последней записывается копия-маркер готовности."""
+    return [(variant_name(name, variant, extension), variant, image_format)
+            for variant in variants
+            for extension, image_format in constants.IMAGE_VARIANT_FORMATS]
+
+
+def variants_ready(name, variants, storage=default_storage):
+    """Проверка копий в хранилище; ответы API читают признак из модели."""
+    marker = variant_names(name, variants)[-1][0]
+    return storage.exists(marker)
+
+
+def variant_urls(name, variants, ready, storage=default_storage):
+    """Ссылки на копии по размерам и форматам.
+
+    Пока копии не готовы, вместо них отдается ссылка на оригинал.
+    """
+    urls = {variant: {} for variant in variants}
+    for path, variant, image_format in variant_names(name, variants):
+        extension = path.rsplit('.', 1)[-1]
+        urls[variant][extension] = storage.url(path if ready else name)
+    return urls
+
+
+def _flatten(image):
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_variants(source, targets):
+    """Декодирование оригинала и запись копий; выполняется в пуле процессов.
+
+    Принимает только пути файловой системы, чтобы не зависеть от Django
+    в дочернем процессе.
+    """
+    largest = max(size for _, size, _ in targets)
+    with Image.open(source) as original:
+        original.draft('RGB', largest)
+        image = ImageOps.exif_transpose(original)
+        for path, size, image_format in targets:
+            variant = image.copy()
+            variant.thumbnail(size, Image.Resampling.LANCZOS)
+            if image_format == 'JPEG' and variant.mode != 'RGB':
+                variant = _flatten(variant)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f'{path}.tmp'
+            variant.save(temporary, image_format,
+                         quality=constants.IMAGE_VARIANT_QUALITY)
+            os.replace(temporary, path)
+
+
+def render_targets(name, variants, storage=default_storage):
+    return [(storage.path(path), constants.IMAGE_VARIANTS[variant],
+             image_format)
+            for path, variant, image_format in variant_names(name, variants)]
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS)
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _release(future, on_ready=None):
+    _slots.release()
+    error = future.exception()
+    if error is not None:
+        logger.warning('Image variants were not rendered: %s', error)
+    elif on_ready is not None:
+        try:
+            on_ready()
+        except Exception:
+            logger.exception('Image variants were not marked as ready')
+
+
+def schedule_variants(name, variants, storage=default_storage,
+                      on_ready=None):
+    """Постановка изображения в очередь пула без ожидания результата.
+
+    Очередь ограничена IMAGE_QUEUE_SIZE: при переполнении изображение
+    пропускается и обрабатывается командой generate_image_variants.
+    on_ready вызывается после записи всех копий в служебном потоке
+    executor, поэтому не должен обращаться к базе.
+    """
+    if not name or not _slots.acquire(blocking=False):
+        return False
+    try:
+        future = get_executor().submit(
+            render_variants, storage.path(name),
+            render_targets(name, variants, storage))
+    except RuntimeError:
+        _slots.release()
+        _reset_executor()
+        return False
+    future.add_done_callback(partial(_release, on_ready=on_ready))
+    return True
+
+
+def delete_variants(name, storage=default_storage):
+    for path, _, _ in variant_names(name, constants.IMAGE_VARIANTS):
+        storage.delete(path)
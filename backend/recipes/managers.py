@@ -1,3 +1,4 @@
+from django.contrib.auth import get_user_model
 from django.db import models
 
 
@@ -15,14 +16,57 @@ class IngredientManager(models.Manager):
 
 class RecipeQuerySet(models.QuerySet):
 
+    def _prefetch_with(self, lookup, related):
+        model = self.model._meta.get_field(lookup).related_model
+        return models.Prefetch(
+            lookup, queryset=model.objects.select_related(related))
+
+    def _prefetch_ids(self, lookup, *fields):
+        """Строки связи без связанных объектов, только их id и fields."""
+        relation = self.model._meta.get_field(lookup)
+        return models.Prefetch(lookup, queryset=(
+            relation.related_model.objects
+            .only(relation.field.name, *fields)))
+
+    def tags_prefetch(self, expand=True):
+        if expand:
+            return self._prefetch_with('recipe_tag', 'tag')
+        return self._prefetch_ids('recipe_tag', 'tag')
+
+    def ingredients_prefetch(self, expand=True):
+        if expand:
+            return self._prefetch_with('recipe_ingredient', 'ingredient')
+        return self._prefetch_ids('recipe_ingredient', 'ingredient',
+                                  'amount')
+
+    def related_prefetches(self):
+        return (self.tags_prefetch(), self.ingredients_prefetch())
+
     def with_related_data(self):
-        return self.prefetch_related('recipe_tag', 'recipe_ingredient')
+        return (self.select_related('author')
+                .prefetch_related(*self.related_prefetches()))
+
+    def with_author_subscription(self, user):
+        authors = get_user_model().objects.is_subscribe(user)
+        return (self.select_related(None)
+                .prefetch_related(models.Prefetch('author',
+                                                  queryset=authors)))
+
+    def with_author_subscribed_flag(self, user):
+        """Подписка на автора флагом рецепта, без загрузки авторов."""
+        return self.annotate(is_author_subscribed=models.Exists(
+            user.followers.filter(following=models.OuterRef('author_id'))))
 
-    def is_favorite_and_shop_cart(self, user):
-        favorite = user.saver.filter(recipe=models.OuterRef('pk'))
-        shopping_cart = user.buyer.filter(purchase=models.OuterRef('pk'))
-        return self.annotate(is_favorited=models.Exists(favorite),
-                             is_in_shopping_cart=models.Exists(shopping_cart))
+    def is_favorite_and_shop_cart(self, user, favorite=True,
+                                  shopping_cart=True):
+        annotations = {}
+        if favorite:
+            annotations['is_favorited'] = models.Exists(
+                user.saver.filter(recipe=models.OuterRef('pk')))
+        if shopping_cart:
+            annotations['is_in_shopping_cart'] = models.Exists(
+                user.buyer.filter(purchase=models.OuterRef('pk')))
+        return self.annotate(**annotations)
 
 
 class RecipeManager(models.Manager):
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def fill_search_name(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    ingredients = list(Ingredient.objects.only('id', 'name'))
+    for ingredient in ingredients:
+        ingredient.search_name = ' '.join(
+            ingredient.name.casefold().replace('ё', 'е').split())
+    Ingredient.objects.bulk_update(ingredients, ['search_name'],
+                                   batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_search_trgm '
+        'ON recipes_ingredient USING gin (search_name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_ingredient_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_alter_recipeingredient_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=128, verbose_name='название для поиска'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
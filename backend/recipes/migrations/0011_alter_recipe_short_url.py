@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+from recipes.utils import backfill_short_urls
+
+
+def backfill(apps, schema_editor):
+    backfill_short_urls(apps.get_model('recipes', 'Recipe'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_search_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_url',
+            field=models.CharField(editable=False, max_length=6, null=True, unique=True, verbose_name='Короткая ссылка'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
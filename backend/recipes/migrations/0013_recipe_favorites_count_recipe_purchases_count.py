@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, key):
+    return Coalesce(Subquery(
+        model._base_manager.filter(**{key: OuterRef('pk')}).order_by()
+        .values(key).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    PurchaseUser = apps.get_model('recipes', 'PurchaseUser')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe._base_manager.update(
+        favorites_count=count_of(Favorite, 'recipe'),
+        purchases_count=count_of(PurchaseUser, 'purchase'))
+    User._base_manager.update(
+        recipes_count=count_of(Recipe, 'author'),
+        followers_count=count_of(Follow, 'following'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_recipe_created_at_id_idx'),
+        ('users', '0008_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='purchases_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
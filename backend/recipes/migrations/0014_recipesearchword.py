@@ -0,0 +1,75 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:05
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector '
+        'tsvector GENERATED ALWAYS AS ('
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+        ') STORED')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+        'ON recipes_recipe USING gin (search_vector)')
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector')
+
+
+def words(text):
+    text = ' '.join(str(text).casefold().replace('ё', 'е').split())
+    return {word[:64] for word in re.findall(r'\w{2,}', text)}
+
+
+def fill_search_words(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeSearchWord = apps.get_model('recipes', 'RecipeSearchWord')
+    batch = []
+    for pk, name, text in Recipe._base_manager.values_list(
+            'pk', 'name', 'text').iterator():
+        weights = dict.fromkeys(words(text), 1)
+        weights.update(dict.fromkeys(words(name), 2))
+        batch += [RecipeSearchWord(recipe_id=pk, word=word, weight=weight)
+                  for word, weight in weights.items()]
+        if len(batch) >= 5000:
+            RecipeSearchWord.objects.bulk_create(batch)
+            batch = []
+    RecipeSearchWord.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_favorites_count_recipe_purchases_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(db_index=True, max_length=64, verbose_name='слово')),
+                ('weight', models.PositiveSmallIntegerField(verbose_name='вес')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_words', to='recipes.recipe', verbose_name='рецепт')),
+            ],
+            options={
+                'verbose_name': 'слово для поиска',
+                'verbose_name_plural': 'Слова для поиска',
+            },
+        ),
+        migrations.RunPython(add_search_vector, remove_search_vector),
+        migrations.RunPython(fill_search_words, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_tags_mask(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    tags = list(Tag._base_manager.order_by('id')[:63])
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag._base_manager.bulk_update(tags, ['bit'])
+    masks = defaultdict(int)
+    for recipe_id, bit in RecipeTag._base_manager.exclude(
+            tag__bit=None).values_list('recipe_id', 'tag__bit').iterator():
+        masks[recipe_id] |= 1 << bit
+    Recipe._base_manager.bulk_update(
+        [Recipe(pk=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ['tags_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipesearchword'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='бит в маске рецептов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='маска тегов'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['tags_mask'], name='recipe_tags_mask_idx'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
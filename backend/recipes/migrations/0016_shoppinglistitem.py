@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    PurchaseUser = apps.get_model('recipes', 'PurchaseUser')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    totals = (PurchaseUser._base_manager
+              .filter(purchase__recipe_ingredient__isnull=False)
+              .values_list('user_id',
+                           'purchase__recipe_ingredient__ingredient_id')
+              .annotate(total=Sum('purchase__recipe_ingredient__amount'))
+              .order_by())
+    ShoppingListItem._base_manager.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          total_amount=total)
+         for user_id, ingredient_id, total in totals.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_tag_bit_recipe_tags_mask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'строка списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+                'ordering': ('user', 'ingredient'),
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='Unique shopping list item constraint')],
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_tags_mask_idx',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+from recipes.constants import RECIPE_IMAGE_VARIANTS
+from recipes.images import variants_ready
+
+BATCH_SIZE = 1000
+
+
+def fill_image_variants_ready(apps, schema_editor):
+    """Один раз проверяет копии в хранилище для каждого изображения."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = (Recipe._base_manager.exclude(image='')
+             .values_list('image', flat=True).order_by().distinct())
+    ready = [name for name in names.iterator()
+             if variants_ready(name, RECIPE_IMAGE_VARIANTS, storage)]
+    for start in range(0, len(ready), BATCH_SIZE):
+        Recipe._base_manager.filter(
+            image__in=ready[start:start + BATCH_SIZE]).update(
+                image_variants_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_remove_recipe_recipe_tags_mask_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='копии изображения готовы'),
+        ),
+        migrations.RunPython(fill_image_variants_ready,
+                             migrations.RunPython.noop),
+    ]
@@ -1,22 +1,30 @@
-import random
-
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Exists
 
 from . import constants
 from .managers import (IngredientManager, IngredientQuerySet,
                        RecipeManager, RecipeQuerySet)
+from .utils import normalize_name, short_url_candidates
 
 User = get_user_model()
 
 
+def create_short_link(*args):
+    """Заглушка для миграции 0001, ссылку теперь задает Recipe.save()."""
+    return None
+
+
 class Ingredient(models.Model):
 
     name = models.CharField('название',
                             max_length=constants.MAX_LENGTH_NAME_INGREDIENT)
     measurement_unit = models.CharField(
         'мера измерения', max_length=constants.MAX_LENGTH_MEASUREMENT_UNIT)
+    search_name = models.CharField(
+        'название для поиска', editable=False, db_index=True,
+        max_length=constants.MAX_LENGTH_NAME_INGREDIENT)
 
     class Meta:
         ordering = ('name', 'id')
@@ -33,12 +41,18 @@ class Ingredient(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     name = models.CharField('название', unique=True,
                             max_length=constants.MAX_LENGTH_TAG)
     slug = models.SlugField('slug название', unique=True,
                             max_length=constants.MAX_LENGTH_TAG)
+    bit = models.PositiveSmallIntegerField(
+        'бит в маске рецептов', unique=True, null=True, editable=False)
 
     class Meta:
         ordering = ('name', 'id')
@@ -49,6 +63,15 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Новому тегу достается свободный бит маски, если он остался."""
+        if self.bit is None:
+            used = set(Tag.objects.exclude(bit=None)
+                       .values_list('bit', flat=True))
+            self.bit = next((bit for bit in range(constants.TAGS_MASK_BITS)
+                             if bit not in used), None)
+        super().save(*args, **kwargs)
+
 
 class Recipe(models.Model):
     name = models.CharField('название',
@@ -58,36 +81,56 @@ class Recipe(models.Model):
                                on_delete=models.CASCADE, verbose_name='автор')
     image = models.ImageField('изображение', upload_to='recipes/images/',
                               null=False, blank=False)
+    image_variants_ready = models.BooleanField(
+        'копии изображения готовы', default=False, editable=False)
     cooking_time = models.IntegerField('время готовки',
                                        validators=[MinValueValidator(
                                            constants.MIN_VALUE)])
     ingredient = models.ManyToManyField(Ingredient, through='RecipeIngredient')
     short_url = models.CharField('Короткая ссылка', editable=False,
-                                 unique=True,
+                                 unique=True, null=True,
                                  max_length=constants.MAX_LENGTH_SHORT_URL)
     tag = models.ManyToManyField(Tag, through='RecipeTag')
     created_at = models.DateTimeField('дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'в избранном', default=0, editable=False)
+    purchases_count = models.PositiveIntegerField(
+        'в списках покупок', default=0, editable=False)
+    tags_mask = models.BigIntegerField('маска тегов', default=0,
+                                       editable=False)
 
     objects = RecipeQuerySet.as_manager()
     tags_and_ingredients = RecipeManager()
 
     def save(self, *args, **kwargs):
-        if not self.short_url:
-            self.short_url = self.create_short_link()
-        super().save(*args, **kwargs)
-
-    def create_short_link(self):
-        not_unique = True
-        while not_unique:
-            short_url = ''.join(
-                random.choices(constants.SYMBOLS_FOR_SHORT_URL,
-                               k=constants.MAX_LENGTH_SHORT_URL))
-            if not Recipe.objects.filter(short_url=short_url).exists():
-                not_unique = False
-        return short_url
+        if self.short_url:
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self.short_url = self.assign_short_url()
+
+    def assign_short_url(self):
+        """Код id рецепта или запасной, если код занят старой ссылкой.
+
+        Обычно это один UPDATE: код записывается, только если его нет
+        у другого рецепта.
+        """
+        manager = Recipe._base_manager
+        for short_url in short_url_candidates(self.pk):
+            if manager.filter(pk=self.pk).filter(~Exists(
+                    manager.filter(short_url=short_url))).update(
+                        short_url=short_url):
+                return short_url
+        raise IntegrityError(f'No free short link for recipe {self.pk}')
+
+    create_short_link = staticmethod(create_short_link)
 
     class Meta:
         ordering = ('-created_at', 'name')
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='recipe_created_at_id_idx'),
+        ]
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
@@ -97,6 +140,23 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeSearchWord(models.Model):
+    """Слова рецепта для поиска на базах без tsvector."""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='search_words',
+                               verbose_name='рецепт')
+    word = models.CharField('слово', db_index=True,
+                            max_length=constants.MAX_LENGTH_SEARCH_WORD)
+    weight = models.PositiveSmallIntegerField('вес')
+
+    class Meta:
+        verbose_name = 'слово для поиска'
+        verbose_name_plural = 'Слова для поиска'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.word}'
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='recipe_ingredient',
@@ -196,3 +256,32 @@ class PurchaseUser(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.purchase}'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Обновляется при изменении корзины и ингредиентов рецептов
+    (см. recipes.shopping_list).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='shopping_list_items',
+                                   verbose_name='ингредиент')
+    total_amount = models.PositiveIntegerField('количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='Unique shopping list item constraint'
+            )
+        ]
+        ordering = ('user', 'ingredient')
+        verbose_name = 'строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.total_amount}'
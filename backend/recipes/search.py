@@ -0,0 +1,46 @@
+import re
+
+from django.db import connections
+
+from . import constants
+from .models import RecipeSearchWord
+from .utils import normalize_name
+
+WORD_PATTERN = re.compile(r'\w{2,}')
+
+
+def uses_search_vector(using):
+    """На PostgreSQL поиск идет по генерируемому столбцу tsvector."""
+    return connections[using].vendor == 'postgresql'
+
+
+def search_words(text):
+    return {word[:constants.MAX_LENGTH_SEARCH_WORD]
+            for word in WORD_PATTERN.findall(normalize_name(text))}
+
+
+def word_weights(name, text):
+    """Слова названия и описания рецепта с их весами."""
+    weights = dict.fromkeys(search_words(text), constants.SEARCH_WEIGHT_TEXT)
+    weights.update(dict.fromkeys(search_words(name),
+                                 constants.SEARCH_WEIGHT_NAME))
+    return weights
+
+
+def recipe_search_words(recipe):
+    return [RecipeSearchWord(recipe_id=recipe.pk, word=word, weight=weight)
+            for word, weight
+            in word_weights(recipe.name, recipe.text).items()]
+
+
+def index_search_words(recipes, using='default', replace=True,
+                       batch_size=5000):
+    """Перестроение слов для поиска рецептов на базах без tsvector."""
+    if uses_search_vector(using):
+        return
+    manager = RecipeSearchWord.objects.db_manager(using)
+    if replace:
+        manager.filter(recipe__in=[recipe.pk for recipe in recipes]).delete()
+    manager.bulk_create(
+        [word for recipe in recipes for word in recipe_search_words(recipe)],
+        batch_size=batch_size)
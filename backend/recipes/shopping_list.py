@@ -0,0 +1,152 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from . import constants
+from .models import PurchaseUser, RecipeIngredient, ShoppingListItem
+
+User = get_user_model()
+
+
+def lock_users(user_ids):
+    """Изменения списка одного пользователя выполняются по очереди.
+
+    Блокировка в порядке id, чтобы параллельные изменения списков
+    нескольких пользователей не ждали друг друга по кругу.
+    """
+    list(User._base_manager.select_for_update().filter(pk__in=user_ids)
+         .order_by('pk').values_list('pk', flat=True))
+
+
+def apply_changes(changes):
+    """Прибавление изменений {(user_id, ingredient_id): delta} к спискам.
+
+    Строки с нулевой суммой удаляются, отсутствующие создаются.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    user_ids = {user_id for user_id, _ in changes}
+    ingredient_ids = {ingredient_id for _, ingredient_id in changes}
+    # вызывается внутри транзакций записи, точка сохранения не нужна
+    with transaction.atomic(savepoint=False):
+        lock_users(user_ids)
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=ingredient_ids).order_by()}
+        created, updated, deleted = [], [], []
+        for (user_id, ingredient_id), delta in changes.items():
+            item = items.get((user_id, ingredient_id))
+            if item is None:
+                # уменьшение отсутствующей строки: список уже разошелся
+                if delta > 0:
+                    created.append(ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        total_amount=delta))
+                continue
+            item.total_amount += delta
+            if item.total_amount > 0:
+                updated.append(item)
+            else:
+                deleted.append(item.pk)
+        ShoppingListItem.objects.bulk_create(
+            created, batch_size=constants.SHOPPING_LIST_BATCH_SIZE)
+        ShoppingListItem.objects.bulk_update(
+            updated, ['total_amount'],
+            batch_size=constants.SHOPPING_LIST_BATCH_SIZE)
+        if deleted:
+            ShoppingListItem.objects.filter(pk__in=deleted).delete()
+
+
+def change_cart(user_id, recipe_ids, sign):
+    """Рецепты добавлены в корзину (sign=1) или убраны из нее (sign=-1)."""
+    changes = defaultdict(int)
+    for ingredient_id, amount in RecipeIngredient._base_manager.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'ingredient_id', 'amount').order_by():
+        changes[user_id, ingredient_id] += sign * amount
+    apply_changes(changes)
+
+
+def change_recipe_ingredients(recipe_id, deltas):
+    """Изменение ингредиентов рецепта {ingredient_id: delta} у покупателей."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    apply_changes({
+        (user_id, ingredient_id): delta
+        for user_id in buyers(recipe_id)
+        for ingredient_id, delta in deltas.items()})
+
+
+def buyers(recipe_id):
+    return set(PurchaseUser.objects.filter(purchase_id=recipe_id)
+               .values_list('user_id', flat=True).order_by())
+
+
+def expected_totals(user_ids):
+    """Суммы ингредиентов по корзинам пользователей из исходных таблиц."""
+    return (PurchaseUser._base_manager
+            .filter(user_id__in=user_ids,
+                    purchase__recipe_ingredient__isnull=False)
+            .values_list('user_id',
+                         'purchase__recipe_ingredient__ingredient_id')
+            .annotate(total=Sum('purchase__recipe_ingredient__amount'))
+            .order_by())
+
+
+def user_batches(user_ids=None,
+                 batch_size=constants.SHOPPING_LIST_BATCH_SIZE):
+    if user_ids is None:
+        user_ids = User._base_manager.order_by('pk').values_list('pk',
+                                                                 flat=True)
+    user_ids = iter(user_ids)
+    while batch := list(islice(user_ids, batch_size)):
+        yield batch
+
+
+def rebuild(user_ids=None, batch_size=constants.SHOPPING_LIST_BATCH_SIZE):
+    """Пересчет списков пользователей (всех, если user_ids не задан).
+
+    Возвращает число записанных строк.
+    """
+    total = 0
+    for batch in user_batches(user_ids, batch_size):
+        with transaction.atomic():
+            lock_users(batch)
+            ShoppingListItem.objects.filter(user_id__in=batch).delete()
+            items = [ShoppingListItem(user_id=user_id,
+                                      ingredient_id=ingredient_id,
+                                      total_amount=amount)
+                     for user_id, ingredient_id, amount
+                     in expected_totals(batch)]
+            ShoppingListItem.objects.bulk_create(items,
+                                                 batch_size=batch_size)
+        total += len(items)
+    return total
+
+
+def differences(user_ids=None, batch_size=constants.SHOPPING_LIST_BATCH_SIZE):
+    """Расхождения списков с корзинами.
+
+    Кортежи (user_id, ingredient_id, ожидаемая сумма, сохраненная сумма),
+    отсутствующая сумма равна 0.
+    """
+    for batch in user_batches(user_ids, batch_size):
+        totals = defaultdict(lambda: [0, 0])
+        for user_id, ingredient_id, amount in expected_totals(batch):
+            totals[user_id, ingredient_id][0] = amount
+        for user_id, ingredient_id, amount in (
+                ShoppingListItem.objects.filter(user_id__in=batch)
+                .values_list('user_id', 'ingredient_id', 'total_amount')
+                .order_by()):
+            totals[user_id, ingredient_id][1] = amount
+        for (user_id, ingredient_id), (expected, stored) in sorted(
+                totals.items()):
+            if expected != stored:
+                yield user_id, ingredient_id, expected, stored
@@ -0,0 +1,177 @@
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django_cleanup.signals import cleanup_post_delete
+
+from users.models import Follow, User
+
+from . import constants
+from .images import delete_variants, schedule_variants, variants_ready
+from .models import Favorite, PurchaseUser, Recipe, RecipeTag
+from .search import index_search_words
+from .shopping_list import change_cart
+from .utils import tags_mask
+
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    PurchaseUser: (Recipe, 'purchase_id', 'purchases_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Follow: (User, 'following_id', 'followers_count'),
+}
+
+# модели, удаления строк которых обрабатывает вызывающий код (api.bulk)
+bulk_models = ContextVar('bulk_models', default=())
+
+IMAGE_FIELDS = {
+    Recipe: ('image', constants.RECIPE_IMAGE_VARIANTS),
+    User: ('avatar', constants.AVATAR_IMAGE_VARIANTS),
+}
+
+# изображения, копии которых записал пул, ждут отметки в потоке Django
+rendered_images = queue.SimpleQueue()
+
+# копии изображений строк pks модели sender готовы, кеши нужно сбросить
+variants_rendered = Signal()
+
+
+@contextmanager
+def bulk_changes(*models):
+    """Обработчики удаления строк models пропускаются внутри блока.
+
+    Счетчики, списки покупок и версии вызывающий код обновляет сам,
+    одним запросом на все строки.
+    """
+    token = bulk_models.set(models)
+    try:
+        yield
+    finally:
+        bulk_models.reset(token)
+
+
+def in_bulk(sender):
+    return sender in bulk_models.get()
+
+
+def change_counter(instance, delta):
+    """Изменение счетчика в той же транзакции, что и изменение строки."""
+    model, key, field = COUNTERS[type(instance)]
+    model.objects.filter(pk=getattr(instance, key)).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=PurchaseUser)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=PurchaseUser)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    if not in_bulk(sender):
+        change_counter(instance, -1)
+
+
+@receiver(post_save, sender=PurchaseUser)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        change_cart(instance.user_id, [instance.purchase_id], 1)
+
+
+@receiver(pre_delete, sender=PurchaseUser)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """До удаления: при удалении рецепта его ингредиенты еще на месте."""
+    if not in_bulk(sender):
+        change_cart(instance.user_id, [instance.purchase_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def render_image_variants(sender, instance, update_fields=None, **kwargs):
+    """Уменьшенные копии нового изображения после фиксации транзакции.
+
+    Готовность копий сохраняется в поле {field}_variants_ready: ответы
+    API читают его, а не проверяют файлы в хранилище.
+    """
+    field, variants = IMAGE_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    image = getattr(instance, field)
+    ready = bool(image) and variants_ready(image.name, variants,
+                                           image.storage)
+    flag = f'{field}_variants_ready'
+    if getattr(instance, flag) != ready:
+        setattr(instance, flag, ready)
+        sender._base_manager.filter(pk=instance.pk).update(**{flag: ready})
+    if image and not ready:
+        name = image.name
+        transaction.on_commit(lambda: schedule_variants(
+            name, variants, image.storage,
+            on_ready=partial(rendered_images.put, (sender, name))))
+
+
+@receiver(request_finished)
+def mark_rendered_images(sender, **kwargs):
+    """Отметка копий, записанных пулом, по окончании запроса.
+
+    Колбэк пула выполняется в служебном потоке executor и только кладет
+    изображение в очередь, а к базе обращается поток обработки запросов.
+    """
+    while True:
+        try:
+            model, name = rendered_images.get_nowait()
+        except queue.Empty:
+            return
+        mark_variants_ready(model, name)
+
+
+def mark_variants_ready(model, name):
+    """Копии изображения name готовы у всех строк с этим изображением.
+
+    Флаг ставится через update() без post_save, кеши сбрасывают
+    получатели variants_rendered.
+    """
+    field, _ = IMAGE_FIELDS[model]
+    flag = f'{field}_variants_ready'
+    pks = list(model._base_manager.filter(
+        **{field: name, flag: False}).values_list('pk', flat=True))
+    if pks:
+        model._base_manager.filter(pk__in=pks).update(**{flag: True})
+        variants_rendered.send(sender=model, pks=pks)
+
+
+@receiver(cleanup_post_delete)
+def delete_image_variants(sender, file_name, file, success, **kwargs):
+    if sender in IMAGE_FIELDS and success:
+        delete_variants(file_name, file.storage)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_words(sender, instance, created, using, update_fields=None,
+                        **kwargs):
+    if update_fields is not None and not {'name', 'text'} & update_fields:
+        return
+    index_search_words([instance], using, replace=not created)
+
+
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def update_tags_mask(sender, instance, **kwargs):
+    """Пересчет маски при изменении тегов в обход сериализатора."""
+    bits = RecipeTag.objects.filter(
+        recipe_id=instance.recipe_id).values_list('tag__bit', flat=True)
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        tags_mask=tags_mask(bits))
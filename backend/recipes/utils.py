@@ -0,0 +1,97 @@
+from django.db import transaction
+
+from . import constants
+
+SHORT_URL_BASE = len(constants.SYMBOLS_FOR_SHORT_URL)
+SHORT_URL_SPACE = SHORT_URL_BASE ** constants.MAX_LENGTH_SHORT_URL
+SHORT_URL_INVERSE = pow(constants.SHORT_URL_MULTIPLIER, -1, SHORT_URL_SPACE)
+
+
+def normalize_name(value):
+    """Приведение названия к виду для поиска: регистр, ё и пробелы."""
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
+
+def tags_mask(bits):
+    """Битовая маска рецепта по битам его тегов."""
+    return sum(1 << bit for bit in set(bits) if bit is not None)
+
+
+def encode_short_url(pk):
+    """Короткая ссылка рецепта: перемешанный id в алфавите ссылок.
+
+    Отображение взаимно однозначно для id меньше SHORT_URL_SPACE,
+    поэтому новые рецепты не занимают коды друг друга; совпасть код
+    может только со старой случайной ссылкой.
+    """
+    value = ((pk * constants.SHORT_URL_MULTIPLIER
+              + constants.SHORT_URL_OFFSET) % SHORT_URL_SPACE)
+    symbols = []
+    for _ in range(constants.MAX_LENGTH_SHORT_URL):
+        value, index = divmod(value, SHORT_URL_BASE)
+        symbols.append(constants.SYMBOLS_FOR_SHORT_URL[index])
+    return ''.join(reversed(symbols))
+
+
+def decode_short_url(short_url):
+    """Id рецепта, которому соответствует короткая ссылка."""
+    value = 0
+    for symbol in short_url:
+        value = (value * SHORT_URL_BASE
+                 + constants.SYMBOLS_FOR_SHORT_URL.index(symbol))
+    return ((value - constants.SHORT_URL_OFFSET) * SHORT_URL_INVERSE
+            % SHORT_URL_SPACE)
+
+
+def short_url_candidates(pk):
+    """Коды ссылки рецепта по порядку: код его id, затем запасные.
+
+    Запасной код нужен, если код id уже занят старой случайной
+    ссылкой. Запасные коды берутся с конца пространства ссылок, куда
+    id рецептов не доходят, и у разных рецептов не совпадают.
+    """
+    yield encode_short_url(pk)
+    for attempt in range(1, constants.SHORT_URL_ATTEMPTS + 1):
+        yield encode_short_url(
+            SHORT_URL_SPACE - pk * constants.SHORT_URL_ATTEMPTS - attempt)
+
+
+def free_short_url(pk, taken):
+    """Первый код рецепта, которого нет среди занятых."""
+    for short_url in short_url_candidates(pk):
+        if short_url not in taken:
+            return short_url
+    raise ValueError(f'No free short link for recipe {pk}')
+
+
+def backfill_short_urls(model, rewrite_all=False, batch_size=1000):
+    """Ссылки для рецептов, у которых ее нет.
+
+    Старые случайные ссылки остаются как есть: если код id рецепта
+    занят одной из них, рецепт получает запасной код. С rewrite_all
+    все ссылки кодируются заново, и старые ссылки перестают работать.
+    Возвращает число измененных рецептов.
+    """
+    manager = model._base_manager
+    taken = set()
+    pending = []
+    for pk, code in manager.values_list('pk', 'short_url').iterator():
+        if code and not rewrite_all:
+            taken.add(code)
+        else:
+            pending.append(pk)
+    codes = {}
+    for pk in sorted(pending):
+        codes[pk] = free_short_url(pk, taken)
+        taken.add(codes[pk])
+    pks = list(codes)
+    batches = [pks[start:start + batch_size]
+               for start in range(0, len(pks), batch_size)]
+    with transaction.atomic():
+        if rewrite_all:
+            # новые коды могут совпасть со старыми кодами других пакетов
+            manager.update(short_url=None)
+        for batch in batches:
+            manager.bulk_update([model(pk=pk, short_url=codes[pk])
+                                 for pk in batch], ['short_url'])
+    return len(codes)
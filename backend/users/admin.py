@@ -11,7 +11,8 @@ class FollowInline(admin.TabularInline):
 
 class UserAdmin(admin.ModelAdmin):
     search_fields = ('username', 'email', 'last_name')
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'is_staff', 'recipes_count', 'followers_count')
     list_filter = ('is_staff', )
     inlines = [FollowInline]
 
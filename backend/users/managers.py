@@ -1,11 +1,24 @@
 from django.contrib.auth.models import UserManager
 from django.db import models
+from django.db.models.functions import RowNumber
 
 
 class UserQuerySet(models.QuerySet, UserManager):
 
-    def with_related_data(self):
-        return self.prefetch_related('followers', 'recipes')
+    def with_recipes_preview(self, limit):
+        """Первые limit рецептов каждого автора одним запросом."""
+        recipe_model = self.model._meta.get_field('recipes').related_model
+        recipes = (recipe_model.objects
+                   .only('id', 'name', 'image', 'image_variants_ready',
+                         'cooking_time', 'author_id')
+                   .annotate(row_number=models.Window(
+                       RowNumber(), partition_by=models.F('author_id'),
+                       order_by=(models.F('created_at').desc(),
+                                 models.F('name').asc())))
+                   .filter(row_number__lte=limit)
+                   .order_by('-created_at', 'name'))
+        return self.prefetch_related(models.Prefetch(
+            'recipes', queryset=recipes, to_attr='recipes_preview'))
 
     def is_subscribe(self, user):
         return self.annotate(is_subscribed=models.Exists(
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+from recipes.constants import AVATAR_IMAGE_VARIANTS
+from recipes.images import variants_ready
+
+BATCH_SIZE = 1000
+
+
+def fill_avatar_variants_ready(apps, schema_editor):
+    """Один раз проверяет копии в хранилище для каждого аватара."""
+    User = apps.get_model('users', 'User')
+    storage = User._meta.get_field('avatar').storage
+    names = (User._base_manager.exclude(avatar='').exclude(avatar=None)
+             .values_list('avatar', flat=True).order_by().distinct())
+    ready = [name for name in names.iterator()
+             if variants_ready(name, AVATAR_IMAGE_VARIANTS, storage)]
+    for start in range(0, len(ready), BATCH_SIZE):
+        User._base_manager.filter(
+            avatar__in=ready[start:start + BATCH_SIZE]).update(
+                avatar_variants_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='копии аватара готовы'),
+        ),
+        migrations.RunPython(fill_avatar_variants_ready,
+                             migrations.RunPython.noop),
+    ]
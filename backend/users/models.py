@@ -25,6 +25,12 @@ class User(AbstractUser):
                               unique=True)
     avatar = models.ImageField('аватар', upload_to='users/images/',
                                blank=True, null=True)
+    avatar_variants_ready = models.BooleanField(
+        'копии аватара готовы', default=False, editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'количество подписчиков', default=0, editable=False)
 
     objects = UserQuerySet.as_manager()
 